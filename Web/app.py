@@ -1,5 +1,5 @@
 # For flask site
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, make_response, g, abort#, send_file, Response # FIXME removed send_file, Response, check if need to return
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, make_response, g, abort, send_file#, Response # FIXME removed Response, check if need to return
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user # FIXME removed UserMixin, check if need to re
 from flask_mail import Mail
 # For security implementaton 
@@ -8,7 +8,9 @@ from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 #from flask_wtf import FlaskForm # FIXME removed, check if need to re-implement
+import json
 import secrets
+from datetime import date
 # For password hashing
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired # FIXME removed, check if need to re-implement
 from werkzeug.security import generate_password_hash
@@ -25,10 +27,25 @@ from config import Config
 # Model imports ( Ads, Users)
 
 from db_models import User, Ad
+from query_utils import (apply_filters, apply_seller, keyset_page, list_query, listing_dict, InvalidCursor, SORTS,
+                         DEFAULT_PER_PAGE, MAX_PER_PAGE, FILTER_FIELDS)
+from phone_utils import phone_key, normalize_phone
+from search_utils import apply_search
+from cache_utils import AppCache
+from facet_utils import get_facet_counts
+from price_utils import backfill_prices_command, price_history, recent_price_drops, DEFAULT_DROP_DAYS, MAX_DROP_DAYS
+from migration_utils import migrate
+from export_utils import stream_query, accepts_gzip, json_response
+from thumbnail_utils import (create_service, url_version, OriginError, ThumbnailError, THUMBNAIL_WIDTHS,
+                             THUMBNAIL_FORMATS, CACHE_MAX_AGE, UNVERSIONED_MAX_AGE)
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 app.config.from_object(Config)
 db.init_app(app)  # Initialize the database with the app
+app_cache = AppCache()  # Query results that only change when a scraper runs
+app_cache.init_app(app)
+PAGE_CACHE_FIELDS = FILTER_FIELDS + ('sort',)
+thumbnails = create_service(app.config)  # Ad images are served resized from /thumb, not hot-linked from the stores
 
 
 translation_manager = init_translation_system(app) # Initialize translation system
@@ -94,7 +111,7 @@ def add_security_headers(response):
         f"script-src 'self' 'nonce-{g.nonce}' https://cdnjs.cloudflare.com;"
         f"style-src 'self' 'nonce-{g.nonce}' https://cdnjs.cloudflare.com;"
         f"font-src 'self' https://cdnjs.cloudflare.com; "
-        f"img-src 'self' data: blob: https://flagcdn.com https://*.com https://reklama5.mk https://media.pazar3.mk; "
+        f"img-src 'self' data: blob: https://flagcdn.com; "  # Ad images come from /thumb
     )
     
     # Other security headers
@@ -348,6 +365,22 @@ def admin_users():
     users = User.query.all()
     return render_template('/routes/admin_users.html', users=users)
 
+@app.route('/admin/export_ads')
+@login_required
+def admin_export_ads():
+    if current_user.role != 'admin':
+        flash('You do not have permission to access this page.', 'danger')
+        return redirect(url_for('index'))
+
+    # Full dump (or filtered with the same query args as the listing), NDJSON unless ?format=json. Cross-posted
+    # copies are rows too, the dump includes them whatever the listing hides
+    export_format = request.args.get('format', 'ndjson')
+    filters = dict(request.args.items(), show_duplicates=True)
+    query = apply_filters(Ad.query, filters).order_by(Ad.id)
+    app.logger.info(f"Admin {current_user.username} exporting ads ({export_format})")
+    return stream_query(query, Ad.to_dict, fmt=export_format, gzip=accepts_gzip(request),
+                        filename=f"ads-{date.today():%Y%m%d}")
+
 # Admin user management routes
 # Allow admin to have more functions such as viewing passwords
 
@@ -395,8 +428,18 @@ def delete_user(user_id):
 
 # Initialize DB
 with app.app_context():
+    # ads.* is created by the migrations in migrations/ (shared with the scrapers), create_all only adds users
+    if app.config['AUTO_MIGRATE']:
+        connection = db.engine.raw_connection()
+        try:
+            for migration in migrate(connection):
+                app.logger.info(f"Applied migration {migration.version:04d}_{migration.name}")
+        finally:
+            connection.close()
     db.create_all()
 
+app.cli.add_command(backfill_prices_command)
+
 # Request Password Reset
 @app.route('/<lang>/reset_password_request', methods=['GET'])
 def reset_password_request(lang):
@@ -481,23 +524,19 @@ def index_lang(lang):
     if page is None:
         return redirect(url_for('index', lang=lang, page=1))
 
-    # Fetch ads for the specified page
-    per_page = 48  # Number of ads per page
-    ads_pagination = Ad.query.paginate(page=page, per_page=per_page, error_out=False)
-    ads = ads_pagination.items
-
+    # Ads are loaded by the client through /fetch_ads_page, the template only needs the locations.
     # For locations server-side, categories is client-side (TODO: maybe change?)
-    locations = [loc[0] for loc in db.session.query(Ad.location).distinct() if loc[0]]
+    locations = app_cache.get_or_set('locations', load_locations)
 
-    # Render the template with ads, pagination, and translations
+    # Render the template with translations
     return render_template('/routes/index.html', 
-                           ads=ads,
                            locations=locations, 
-                           current_page=page, 
-                           pagination=ads_pagination,
                            translations=translations,
                            current_lang=lang)
 
+def load_locations():
+    return [loc[0] for loc in db.session.query(Ad.location).distinct() if loc[0]]
+
 @app.route('/set_language/<lang>/')
 def set_language(lang):
     # Add detailed logging
@@ -569,6 +608,7 @@ def fetch_ads():
         data = request.json
         category = data.get('category')
         sort_type = data.get('sort')
+        export_format = data.get('format', 'json')  # json (array) or ndjson
         app.logger.info(f"Fetching ads with category: {category}, sort: {sort_type}")
 
         query = Ad.query
@@ -584,47 +624,230 @@ def fetch_ads():
         elif sort_type == "Најстари":
             query = query.order_by(Ad.date.asc())
         elif sort_type == "Најефтини":
-            query = query.order_by(Ad.price.asc())
+            query = query.order_by(Ad.price_mkd.asc())
         elif sort_type == "Најскапи":
-            query = query.order_by(Ad.price.desc())
+            query = query.order_by(Ad.price_mkd.desc())
 
-        ads = query.all()
-        app.logger.info(f"Fetched {len(ads)} ads from the database.")
-
-        ads_list = [ad.to_dict() for ad in ads]
-
-        return jsonify(ads_list)
+        # Streamed from a server-side cursor, this can be the whole table
+        return stream_query(query, Ad.to_dict, fmt=export_format, gzip=accepts_gzip(request))
     except Exception as e:
         app.logger.error(f"Error fetching ads: {e}")
         return jsonify({"error": "An error occurred while fetching ads."}), 500
 
+@app.route('/fetch_ads_page', methods=['POST'])
+def fetch_ads_page():
+    try:
+        validate_csrf(request.headers.get('X-CSRFToken'))
+    except (CSRFError, KeyError):
+        app.logger.error("CSRF token validation failed.")
+        abort(400, description="CSRF token is missing or invalid")
+
+    data = request.json or {}
+    sort_type = data.get('sort')
+    cursor = data.get('cursor')
+    try:
+        per_page = min(max(int(data.get('per_page', DEFAULT_PER_PAGE)), 1), MAX_PER_PAGE)
+    except (TypeError, ValueError):
+        per_page = DEFAULT_PER_PAGE
+
+    def load_page():
+        query = apply_filters(list_query(), data)
+
+        # Total is only counted for the first page, the client keeps it while paging with cursors
+        total = query.count() if not cursor else None
+
+        rows, next_cursor = keyset_page(query, sort=sort_type, cursor=cursor, per_page=per_page)
+        app.logger.info(f"Fetched page of {len(rows)} ads (sort: {sort_type}, cursor: {cursor})")
+        return {
+            'ads': [listing_dict(row) for row in rows],
+            'next_cursor': next_cursor,
+            'total': total
+        }
+
+    try:
+        if cursor:
+            return json_response(load_page())
+        # First pages (every visitor starts on one) are cached per filter combination until the next scrape
+        key = 'ads_page:' + json.dumps([data.get(name) for name in PAGE_CACHE_FIELDS] + [per_page])
+        return json_response(app_cache.get_or_set(key, load_page))
+    except InvalidCursor as e:
+        app.logger.warning(str(e))
+        return json_response({"error": "Invalid cursor."}, 400)
+    except Exception as e:
+        app.logger.error(f"Error fetching ads page: {e}")
+        return json_response({"error": "An error occurred while fetching ads."}, 500)
+
+@app.route('/search', methods=['POST'])
+def search():
+    try:
+        validate_csrf(request.headers.get('X-CSRFToken'))
+    except (CSRFError, KeyError):
+        app.logger.error("CSRF token validation failed.")
+        abort(400, description="CSRF token is missing or invalid")
+
+    data = request.json or {}
+    cursor = data.get('cursor')
+    fields = [field for field in ('title', 'desc') if data.get(field, True)] or ['title', 'desc']
+    try:
+        per_page = min(max(int(data.get('per_page', DEFAULT_PER_PAGE)), 1), MAX_PER_PAGE)
+    except (TypeError, ValueError):
+        per_page = DEFAULT_PER_PAGE
+
+    try:
+        query, rank = apply_search(list_query(), data.get('q'), match=data.get('match', 'every'), fields=fields)
+        if query is None:
+            return json_response({'ads': [], 'next_cursor': None, 'total': 0})
+        query = apply_filters(query, data)
+
+        total = query.count() if not cursor else None
+
+        # Ranked by relevance unless the user picked one of the regular sorts
+        sorts = dict(SORTS, relevance=(rank, True))
+        rows, next_cursor = keyset_page(query, sort=data.get('sort'), cursor=cursor, per_page=per_page,
+                                        sorts=sorts, default_sort='relevance')
+        app.logger.info(f"Search '{data.get('q')}' returned {len(rows)} ads")
+
+        return json_response({
+            'ads': [listing_dict(row) for row in rows],
+            'next_cursor': next_cursor,
+            'total': total
+        })
+    except InvalidCursor as e:
+        app.logger.warning(str(e))
+        return json_response({"error": "Invalid cursor."}, 400)
+    except Exception as e:
+        app.logger.error(f"Error searching ads: {e}")
+        return json_response({"error": "An error occurred while searching ads."}, 500)
+
+@app.route('/ad_details', methods=['POST'])
+def ad_details():
+    try:
+        validate_csrf(request.headers.get('X-CSRFToken'))
+    except (CSRFError, KeyError):
+        app.logger.error("CSRF token validation failed.")
+        abort(400, description="CSRF token is missing or invalid")
+
+    # Full ads (with the description) for the ids of one page, the listings only send the card fields
+    data = request.json or {}
+    try:
+        ids = [int(ad_id) for ad_id in data.get('ids') or []][:MAX_PER_PAGE]
+    except (TypeError, ValueError):
+        return json_response({"error": "Invalid ids."}, 400)
+
+    try:
+        ads = Ad.query.filter(Ad.id.in_(ids)).all() if ids else []
+        return json_response({'ads': [ad.to_dict() for ad in ads]})
+    except Exception as e:
+        app.logger.error(f"Error fetching ad details: {e}")
+        return json_response({"error": "An error occurred while fetching ads."}, 500)
+
+@app.route('/facets', methods=['POST'])
+def facets():
+    try:
+        validate_csrf(request.headers.get('X-CSRFToken'))
+    except (CSRFError, KeyError):
+        app.logger.error("CSRF token validation failed.")
+        abort(400, description="CSRF token is missing or invalid")
+
+    data = request.json or {}
+    filters = {name: data.get(name) for name in FILTER_FIELDS}
+    try:
+        # Counts per category, location, store and price bucket, each one narrowed by the other active filters
+        key = 'facets:' + json.dumps([filters[name] for name in FILTER_FIELDS])
+        return jsonify(app_cache.get_or_set(key, lambda: get_facet_counts(filters)))
+    except Exception as e:
+        app.logger.error(f"Error fetching facets: {e}")
+        return jsonify({"error": "An error occurred while fetching facets."}), 500
+
+def _drop_days():
+    days = request.args.get('days', DEFAULT_DROP_DAYS, type=int)
+    return min(max(days, 1), MAX_DROP_DAYS)
+
+@app.route('/seller/<path:phone>')
+def seller_ads(phone):
+    # Every ad with this phone number on any store, newest first. Any spelling of the number works
+    # (078 123 456, +38978123456, 078/123-456), all of them map to the same key
+    key = phone_key(phone)
+    if key is None:
+        return json_response({"error": "Invalid phone number."}, 404)
+
+    sort_type = request.args.get('sort')
+    cursor = request.args.get('cursor')
+    per_page = min(max(request.args.get('per_page', DEFAULT_PER_PAGE, type=int), 1), MAX_PER_PAGE)
+    try:
+        # Cross-posted copies are kept, a seller's ads on every store is what this page is for
+        query = apply_seller(list_query(), key)
+        total = query.count() if not cursor else None
+        rows, next_cursor = keyset_page(query, sort=sort_type, cursor=cursor, per_page=per_page)
+        return json_response({
+            'phone': normalize_phone(phone),
+            'ads': [listing_dict(row) for row in rows],
+            'next_cursor': next_cursor,
+            'total': total
+        })
+    except InvalidCursor as e:
+        app.logger.warning(str(e))
+        return json_response({"error": "Invalid cursor."}, 400)
+    except Exception as e:
+        app.logger.error(f"Error fetching ads of seller {phone}: {e}")
+        return json_response({"error": "An error occurred while fetching the seller's ads."}, 500)
+
+@app.route('/api/ads/<int:ad_id>/prices')
+def api_ad_prices(ad_id):
+    # Price series of one ad and its drops in the last ?days= days
+    try:
+        return json_response(price_history(ad_id, days=_drop_days()))
+    except Exception as e:
+        app.logger.error(f"Error fetching price history of ad {ad_id}: {e}")
+        return json_response({"error": "An error occurred while fetching the price history."}, 500)
+
+@app.route('/api/price_drops')
+def api_price_drops():
+    days = _drop_days()
+    limit = min(max(request.args.get('limit', DEFAULT_PER_PAGE, type=int), 1), MAX_PER_PAGE)
+    try:
+        drops = app_cache.get_or_set(f'price_drops:{days}:{limit}', lambda: recent_price_drops(days=days, limit=limit))
+        return json_response({'drops': drops})
+    except Exception as e:
+        app.logger.error(f"Error fetching price drops: {e}")
+        return json_response({"error": "An error occurred while fetching price drops."}, 500)
+
 @app.route('/fetch_categories', methods=['POST'])
 def fetch_categories():
+    return jsonify(app_cache.get_or_set('categories', load_categories))
+
+def load_categories():
     # Get all unique categories from your database
     categories = db.session.query(Ad.category).distinct().all()
     # Convert from tuple format to list
-    category_list = [cat[0] for cat in categories if cat[0]]
-    return jsonify(category_list)
-
-""" @app.route('/proxy_image')
-def proxy_image():
-    image_url = request.args.get("url")
+    return [cat[0] for cat in categories if cat[0]]
+
+@app.route('/thumb/<int:ad_id>/<int:width>.<fmt>')
+def thumbnail(ad_id, width, fmt):
+    # Resized ad image from the on-disk cache (thumbnail_utils.py), the store is only contacted on the first request
+    if width not in THUMBNAIL_WIDTHS or fmt not in THUMBNAIL_FORMATS:
+        abort(404)
+    image_url = db.session.query(Ad.image_url).filter(Ad.id == ad_id).scalar()
     if not image_url:
-        return "No URL provided", 400
+        abort(404)
 
     try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        image_response = requests.get(image_url, timeout=10, headers=headers, stream=True)
-        image_response.raise_for_status()
-
-        # Ensure CORS headers are included
-        response = Response(image_response.content, content_type=image_response.headers["Content-Type"])
-        response.headers['Access-Control-Allow-Origin'] = 'https://reklama5.mk'  # Allow all origins to access
-        return response
-    except requests.exceptions.RequestException as e:
-        print("Proxy Error:", e)
-        return "Error fetching image", 404 """
-    # For future use maybe no need now
+        thumb = thumbnails.get(image_url, width, fmt)
+    except OriginError as e:
+        app.logger.warning(str(e))
+        abort(502)
+    except ThumbnailError as e:
+        app.logger.warning(f"Ad {ad_id}: {e}")
+        abort(415)
+
+    # The version changes with the image_url, so a versioned URL always shows the same image
+    versioned = request.args.get('v') == url_version(image_url)
+    response = send_file(thumb.path, mimetype=thumb.mimetype, etag=thumb.etag, conditional=True,
+                         max_age=CACHE_MAX_AGE if versioned else UNVERSIONED_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = versioned
+    return response
+
 
 @app.route('/<lang>/about')
 def about(lang):
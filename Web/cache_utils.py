@@ -0,0 +1,125 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import text
+from extensions import db
+
+# Cached values only change when a scraper, the dead link sweeper or a maintenance command writes to ads.ads. They
+# bump the generation counter in ads.scrape_generation (migrations/0003_scrape_generation.sql) when they finish,
+# every cache key includes it, so old entries are never read again
+GENERATION_CHECK_INTERVAL = 5  # Seconds between generation lookups, the only query a cached page still makes
+DEFAULT_TTL = 300
+MAX_ENTRIES = 1024  # In-process backend
+
+# Same statement as main/ad_sink.py
+BUMP_GENERATION_SQL = """
+    INSERT INTO ads.scrape_generation (id, generation) VALUES (1, 1)
+    ON CONFLICT (id) DO UPDATE SET generation = ads.scrape_generation.generation + 1, updated_at = now()
+"""
+
+
+def bump_generation():
+    """Invalidate every cached page, for commands that change ads.ads from the web app's side"""
+    db.session.execute(text(BUMP_GENERATION_SQL))
+    db.session.commit()
+
+
+class LRUBackend:
+    """In-process LRU with per entry TTL. Every worker process has its own copy"""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class RedisBackend:
+    """Shared between workers. Works with any client that has Redis' get/set(ex=), redis-py or a local stand-in"""
+
+    def __init__(self, client, prefix='marketscraper:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl))
+
+
+class NullBackend:
+    """Caches nothing, every request runs its queries (CACHE_TYPE=null, used by query_bench.py)"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+
+def create_backend(config):
+    # CACHE_TYPE=redis with CACHE_REDIS_URL, null disables caching, anything else keeps the cache in-process
+    cache_type = (config.get('CACHE_TYPE') or '').lower()
+    if cache_type in ('redis', 'rediscache'):
+        import redis  # Only needed for the shared backend
+        return RedisBackend(redis.Redis.from_url(config['CACHE_REDIS_URL']))
+    if cache_type in ('null', 'nullcache'):
+        return NullBackend()
+    return LRUBackend()
+
+
+class AppCache:
+    """Caches JSON-serializable query results until the next scrape finishes (or the TTL runs out).
+
+    Usage:
+        locations = app_cache.get_or_set('locations', load_locations)
+    """
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL):
+        self.backend = backend or LRUBackend()
+        self.ttl = ttl
+        self._generation = 0
+        self._generation_checked = 0.0
+
+    def init_app(self, app):
+        self.backend = create_backend(app.config)
+        self.ttl = app.config.get('CACHE_DEFAULT_TIMEOUT') or DEFAULT_TTL
+
+    def generation(self):
+        now = time.monotonic()
+        if now - self._generation_checked > GENERATION_CHECK_INTERVAL:
+            try:
+                self._generation = db.session.execute(
+                    text("SELECT generation FROM ads.scrape_generation WHERE id = 1")).scalar() or 0
+            except Exception:
+                db.session.rollback()  # Keep the last known generation, the TTL still expires entries
+            self._generation_checked = now
+        return self._generation
+
+    def get_or_set(self, key, func, ttl=None):
+        full_key = f"{self.generation()}:{key}"
+        value = self.backend.get(full_key)
+        if value is None:
+            value = func()
+            self.backend.set(full_key, value, ttl or self.ttl)
+        return value
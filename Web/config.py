@@ -21,6 +21,7 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI')
     SQLALCHEMY_TRACK_MODIFICATIONS = os.getenv('SQLALCHEMY_TRACK_MODIFICATIONS') == 'True'
+    AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', 'True') == 'True'  # Apply pending migrations on startup (migration_utils.py)
     
     MAIL_SERVER = os.getenv('MAIL_SERVER')
     MAIL_PORT = int(os.getenv('MAIL_PORT', 587))
@@ -36,6 +37,11 @@ class Config:
     
     CACHE_TYPE = os.getenv('CACHE_TYPE')
     CACHE_DEFAULT_TIMEOUT = int(os.getenv('CACHE_DEFAULT_TIMEOUT', 300))
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')  # Only used with CACHE_TYPE=redis
+
+    THUMBNAIL_CACHE_DIR = os.getenv('THUMBNAIL_CACHE_DIR')  # Default Web/.thumbnail_cache
+    THUMBNAIL_CACHE_MAX_MB = int(os.getenv('THUMBNAIL_CACHE_MAX_MB', 1024))
+    THUMBNAIL_LOCAL_ORIGIN = os.getenv('THUMBNAIL_LOCAL_ORIGIN')  # Directory that stands in for the stores' image hosts
     
     DB_HOST = os.getenv('DB_HOST')
     DB_USER = os.getenv('DB_USER')
@@ -4,6 +4,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import date
 from extensions import db
 from sqlalchemy.dialects.postgresql import ARRAY
+from thumbnail_utils import thumbnail_url
 
 class Ad(db.Model):
     __tablename__ = "ads"
@@ -18,9 +19,15 @@ class Ad(db.Model):
     phone = db.Column(ARRAY(db.Text), nullable=False)  # Postgres text[] array, NOT NULL
     date = db.Column(db.Date, nullable=False)
     price = db.Column(db.Text, nullable=True)  # price is text in SQL (maybe better to change later)
+    # Numeric price columns, filled by a trigger from price and currency (see price_utils.py)
+    price_value = db.Column(db.BigInteger, nullable=True)  # NULL for По Договор
+    price_mkd = db.Column(db.Numeric, nullable=False)  # 0 for negotiable, never NULL (keyset sort key)
+    price_eur = db.Column(db.Numeric, nullable=False)
     currency = db.Column(db.Text, nullable=True)
     location = db.Column(db.Text, nullable=False)
     store = db.Column(db.Text, nullable=False)
+    # Id of the first posting when the ad was cross-posted, NULL without copies (main/dedup.py)
+    cluster_id = db.Column(db.Integer, nullable=True)
 
     def __init__(self, title, description, link, image_url, category, phone, date, price, currency, store, location):
         self.title = title
@@ -37,17 +44,20 @@ class Ad(db.Model):
 
     def to_dict(self):
         return {
+            'adid': self.id,
             'adlink': self.link,
             'adtitle': self.title,
             'adprice': self.price,
             'adcurrency': self.currency,
             'adcategory': self.category,
             'adimage': self.image_url,
+            'adthumb': thumbnail_url(self.id, self.image_url),
             'adphone': self.phone if self.phone else [],
             'adlocation': self.location,
             'addate': self.date.strftime("%d.%m.%Y") if self.date else "N/A",
             'addesc': self.description,
-            'adstore': self.store
+            'adstore': self.store,
+            'adcluster': self.cluster_id
         }
 
 """ class Ad(db.Model):
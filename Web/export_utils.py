@@ -0,0 +1,109 @@
+import json
+import zlib
+from decimal import Decimal
+from flask import Response, current_app, stream_with_context
+
+# Streaming responses for big result sets. Rows come from a server-side cursor (yield_per), every row is serialized
+# and written out on its own, so memory stays at one batch of rows no matter how many ads the export has
+EXPORT_FORMATS = {
+    'json': 'application/json',  # One JSON array, what /fetch_ads always returned
+    'ndjson': 'application/x-ndjson',  # One JSON object per line, can be processed before the download ends
+}
+YIELD_PER = 1000  # Rows fetched from the cursor at a time
+CHUNK_SIZE = 64 * 1024  # Bytes collected before a write, one per ad would mean thousands of tiny writes
+GZIP_LEVEL = 6
+
+# orjson encodes the listing payloads several times faster than the json module and returns bytes directly.
+# Optional, without it responses are the same JSON from the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value):
+    """Compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    """jsonify() replacement for the hot endpoints, encoded with dumps()"""
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+def json_array_chunks(items):
+    yield b'['
+    for index, item in enumerate(items):
+        yield (b',' if index else b'') + dumps(item)
+    yield b']'
+
+
+def ndjson_chunks(items):
+    for item in items:
+        yield dumps(item) + b'\n'
+
+
+def buffered(chunks, size=CHUNK_SIZE):
+    """Join small byte chunks into ~size pieces"""
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    # wbits=31 writes the gzip header and trailer, so the stream is a regular Content-Encoding: gzip body
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(request):
+    return request.accept_encodings['gzip'] > 0
+
+
+def stream_query(query, serialize, fmt='json', gzip=False, yield_per=YIELD_PER, filename=None):
+    """Stream the rows of a query as a JSON array or NDJSON, serialize turns one row into a dict.
+
+    Usage:
+        return stream_query(Ad.query.order_by(Ad.id), Ad.to_dict, fmt='ndjson', gzip=accepts_gzip(request))
+    """
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'json'
+
+    def rows():
+        try:
+            for row in query.yield_per(yield_per):
+                yield serialize(row)
+        except Exception as e:
+            # Headers are already sent, all that can be done is to log it and cut the response short
+            current_app.logger.error(f"Export stopped after an error: {e}")
+            raise
+
+    chunks = json_array_chunks(rows()) if fmt == 'json' else ndjson_chunks(rows())
+    body = buffered(chunks)
+    headers = {'Vary': 'Accept-Encoding', 'X-Accel-Buffering': 'no'}  # nginx would buffer the whole export otherwise
+    if gzip:
+        body = gzip_chunks(body)
+        headers['Content-Encoding'] = 'gzip'
+    if filename:
+        headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+
+    # stream_with_context keeps the request (and its DB session) alive until the last row is written
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[fmt], headers=headers)
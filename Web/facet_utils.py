@@ -0,0 +1,79 @@
+from sqlalchemy import column, func, table, text
+from extensions import db
+from db_models import Ad
+from query_utils import apply_filters
+
+# Number of ads for every (category, location, store, price bucket) combination that exists, see
+# migrations/0005_facet_counts.sql for the table and the ads.price_bucket() function.
+# The scrapers' ad sink adds to it in the same statement that inserts ads, checkDeletedAds subtracts what it deletes.
+# Only listed ads are counted, cross-posted copies are hidden by apply_filters and left out here too
+# (migrations/0012_listed_facet_counts.sql, main/dedup.py adjusts the counts when it marks a copy)
+
+# Full recount, used after price changes (and to fix the table if it ever drifts)
+REBUILD_FACETS_SQL = [
+    "DELETE FROM ads.facet_counts",
+    """
+    INSERT INTO ads.facet_counts (category, location, store, price_bucket, count)
+    SELECT coalesce(category, ''), coalesce(location, ''), store, ads.price_bucket(price_value, price_mkd), count(*)
+    FROM ads.ads WHERE cluster_id IS NULL OR cluster_id = id GROUP BY 1, 2, 3, 4
+    """,
+]
+
+FACETS = ('category', 'location', 'store', 'price_bucket')
+# Filters that narrow each facet itself. A facet's counts ignore its own filters, so the sidebar shows how many
+# ads every other option would give
+OWN_FILTERS = {
+    'category': ('category',),
+    'location': ('location',),
+    'store': ('store',),
+    'price_bucket': ('exclude_negotiable', 'exclude_price_1', 'min_price', 'max_price'),
+}
+
+facet_counts = table('facet_counts', column('category'), column('location'), column('store'),
+                     column('price_bucket'), column('count'), schema='ads')
+price_bucket = func.ads.price_bucket(Ad.price_value, Ad.price_mkd)
+
+
+def rebuild_facet_counts(commit=True):
+    for statement in REBUILD_FACETS_SQL:
+        db.session.execute(text(statement))
+    if commit:
+        db.session.commit()
+
+
+def _cube_counts(facet, filters):
+    key = facet_counts.c[facet]
+    query = (db.session.query(key, func.sum(facet_counts.c.count))
+             .filter(facet_counts.c.count > 0)
+             .group_by(key))
+    for name in ('category', 'location', 'store'):
+        value = (filters.get(name) or '').strip()
+        if value:
+            query = query.filter(facet_counts.c[name] == value)
+    if filters.get('exclude_negotiable'):
+        query = query.filter(facet_counts.c.price_bucket != 'negotiable')
+    if filters.get('exclude_price_1'):
+        query = query.filter(facet_counts.c.price_bucket != '1')
+    return query
+
+
+def _live_counts(facet, filters):
+    # A price range doesn't line up with the buckets, those counts come from ads.ads itself
+    key = price_bucket if facet == 'price_bucket' else getattr(Ad, facet)
+    query = db.session.query(key, func.count()).group_by(key)
+    return apply_filters(query, filters)
+
+
+def get_facet_counts(filters):
+    """{facet: {value: count}} for the sidebar, every facet filtered by all the other active filters"""
+    result = {}
+    for facet in FACETS:
+        other_filters = {name: value for name, value in filters.items() if name not in OWN_FILTERS[facet]}
+        # The table only has listed ads, counts that include the copies come from ads.ads as well
+        if (other_filters.get('min_price') not in (None, '') or other_filters.get('max_price') not in (None, '')
+                or other_filters.get('show_duplicates')):
+            query = _live_counts(facet, other_filters)
+        else:
+            query = _cube_counts(facet, other_filters)
+        result[facet] = {value: int(count) for value, count in query if value}
+    return result
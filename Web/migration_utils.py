@@ -0,0 +1,169 @@
+import argparse
+import hashlib
+import os
+import re
+from collections import namedtuple
+
+# Versioned schema migrations shared by the web app and the scrapers (main/ imports this module the same way it
+# imports config). Every file in migrations/ is named NNNN_description.sql and runs once, in version order, inside
+# its own transaction. Applied versions are recorded in ads.schema_migrations.
+#
+# Migrations only ever move forward, a change to the schema is a new file. Statements use IF NOT EXISTS / OR REPLACE,
+# so databases created by the old ensure_*_schema() startup code are brought under version control without errors.
+#
+#   python migration_utils.py            apply pending migrations
+#   python migration_utils.py --status   list applied and pending versions
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+
+# Session advisory lock, so gunicorn workers starting together and a scraper run don't migrate at the same time
+LOCK_ID = 7310452
+LOCK_SQL = f"SELECT pg_advisory_lock({LOCK_ID})"
+UNLOCK_SQL = f"SELECT pg_advisory_unlock({LOCK_ID})"
+
+HISTORY_SQL = """
+    CREATE SCHEMA IF NOT EXISTS ads;
+    CREATE TABLE IF NOT EXISTS ads.schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        checksum TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+APPLIED_SQL = "SELECT version, checksum FROM ads.schema_migrations"
+# psycopg2 and asyncpg use different placeholders
+RECORD_SQL = "INSERT INTO ads.schema_migrations (version, name, checksum) VALUES (%s, %s, %s)"
+RECORD_SQL_ASYNC = "INSERT INTO ads.schema_migrations (version, name, checksum) VALUES ($1, $2, $3)"
+
+Migration = namedtuple('Migration', 'version name sql checksum')
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """All migrations on disk, sorted by version"""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding='utf-8') as f:
+            sql = f.read()  # Universal newlines, a Windows checkout hashes the same
+        migrations.append(Migration(int(match.group(1)), match.group(2), sql,
+                                    hashlib.sha256(sql.encode('utf-8')).hexdigest()))
+    migrations.sort(key=lambda migration: migration.version)
+
+    versions = [migration.version for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError(f"Duplicate migration version in {directory}")
+    return migrations
+
+
+def pending_migrations(applied, target=None, directory=MIGRATIONS_DIR):
+    """Migrations not in `applied` ({version: checksum}) up to target (inclusive), also checks the applied ones"""
+    pending = []
+    for migration in load_migrations(directory):
+        if target is not None and migration.version > target:
+            break
+        checksum = applied.get(migration.version)
+        if checksum is None:
+            pending.append(migration)
+        elif checksum != migration.checksum:
+            # Already ran with different SQL, editing it won't do anything. The change belongs in a new migration
+            raise MigrationError(f"Migration {migration.version:04d}_{migration.name} was changed after it was applied")
+    return pending
+
+
+def migrate(conn, target=None, directory=MIGRATIONS_DIR):
+    """Apply pending migrations on a DB-API connection (psycopg2, or SQLAlchemy's engine.raw_connection()).
+    Returns the migrations that were applied"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(LOCK_SQL)
+        cursor.execute(HISTORY_SQL)
+        conn.commit()
+
+        cursor.execute(APPLIED_SQL)
+        applied = dict(cursor.fetchall())
+        pending = pending_migrations(applied, target, directory)
+        for migration in pending:
+            try:
+                cursor.execute(migration.sql)
+                cursor.execute(RECORD_SQL, (migration.version, migration.name, migration.checksum))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return pending
+    finally:
+        conn.rollback()  # Leaves a failed transaction, the unlock can't run inside it
+        cursor.execute(UNLOCK_SQL)
+        conn.commit()
+        cursor.close()
+
+
+async def migrate_async(conn, target=None, directory=MIGRATIONS_DIR):
+    """Same as migrate() on an asyncpg connection, used by the scrapers"""
+    await conn.execute(LOCK_SQL)
+    try:
+        await conn.execute(HISTORY_SQL)
+        applied = {row['version']: row['checksum'] for row in await conn.fetch(APPLIED_SQL)}
+        pending = pending_migrations(applied, target, directory)
+        for migration in pending:
+            async with conn.transaction():
+                await conn.execute(migration.sql)
+                await conn.execute(RECORD_SQL_ASYNC, migration.version, migration.name, migration.checksum)
+        return pending
+    finally:
+        await conn.execute(UNLOCK_SQL)
+
+
+def applied_versions(conn):
+    """{version: applied_at} on a DB-API connection, empty before the first migration"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT to_regclass('ads.schema_migrations') IS NOT NULL")
+        if not cursor.fetchone()[0]:
+            return {}
+        cursor.execute("SELECT version, applied_at FROM ads.schema_migrations")
+        return dict(cursor.fetchall())
+    finally:
+        conn.rollback()
+        cursor.close()
+
+
+def connect():
+    # Same settings as the scrapers' DB_CONFIG
+    import psycopg2
+    from config import Config
+    return psycopg2.connect(host=Config.DB_HOST, port=int(Config.DB_PORT or 5432), dbname=Config.DB_NAME,
+                            user=Config.DB_USER, password=Config.DB_PASSWORD)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the schema migrations in Web/migrations")
+    parser.add_argument('--status', action='store_true', help="Only list applied and pending migrations")
+    parser.add_argument('--target', type=int, help="Stop after this version")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        if args.status:
+            applied = applied_versions(conn)
+            for migration in load_migrations():
+                state = f"applied {applied[migration.version]:%Y-%m-%d %H:%M}" if migration.version in applied else "pending"
+                print(f"{migration.version:04d}_{migration.name}: {state}")
+            return
+
+        applied = migrate(conn, target=args.target)
+        for migration in applied:
+            print(f"Applied {migration.version:04d}_{migration.name}")
+        print(f"Schema is up to date ({len(applied)} migrations applied).")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+-- Scraped ads, written by the scrapers (main/ad_sink.py) and read by the web app (db_models.Ad)
+CREATE SCHEMA IF NOT EXISTS ads;
+
+CREATE TABLE IF NOT EXISTS ads.ads (
+    id SERIAL PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    link TEXT NOT NULL UNIQUE,
+    image_url TEXT,
+    category TEXT,
+    phone TEXT[] NOT NULL,
+    date DATE NOT NULL,
+    price TEXT,
+    currency TEXT,
+    location TEXT NOT NULL,
+    store TEXT NOT NULL
+);
@@ -0,0 +1,26 @@
+-- Full-text and trigram search (search_utils.py). Text is normalized inside Postgres (lowercase + latin -> cyrillic),
+-- so the scrapers don't need to change and the same function is used on the query side.
+-- ads.translit_mk is the SQL twin of search_utils.transliterate, keep the two in sync.
+-- IMMUTABLE is required for generated columns
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE OR REPLACE FUNCTION ads.translit_mk(input text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT translate(
+        replace(replace(replace(replace(replace(replace(replace(replace(replace(
+            lower(coalesce(input, '')),
+            'gj', 'ѓ'), 'zh', 'ж'), 'dz', 'ѕ'), 'lj', 'љ'), 'nj', 'њ'), 'kj', 'ќ'), 'ch', 'ч'), 'dj', 'џ'), 'sh', 'ш'),
+        'abvgdezijklmnoprstufhc', 'абвгдезијклмнопрстуфхц')
+$$;
+
+ALTER TABLE ads.ads ADD COLUMN IF NOT EXISTS search_text text
+GENERATED ALWAYS AS (ads.translit_mk(title) || ' ' || ads.translit_mk(description)) STORED;
+
+ALTER TABLE ads.ads ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', ads.translit_mk(title)), 'A') ||
+    setweight(to_tsvector('simple', ads.translit_mk(description)), 'B')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS ads_search_vector_idx ON ads.ads USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS ads_search_text_trgm_idx ON ads.ads USING gin (search_text gin_trgm_ops);
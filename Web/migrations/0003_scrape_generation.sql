@@ -0,0 +1,8 @@
+-- Bumped by the scrapers and the dead link sweeper when they finish, the web app's cache keys include it (cache_utils.py)
+CREATE TABLE IF NOT EXISTS ads.scrape_generation (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    generation BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO ads.scrape_generation (id) VALUES (1) ON CONFLICT DO NOTHING;
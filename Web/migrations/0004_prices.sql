@@ -0,0 +1,58 @@
+-- Price is scraped as text ("12000" or "По Договор"). A trigger keeps three numeric columns next to it:
+--   price_value  the number itself, NULL for negotiable prices
+--   price_mkd    price in MKD, negotiable counts as 0 (so the keyset sort keys are never NULL)
+--   price_eur    price in EUR
+-- Rates live in ads.exchange_rates, unknown currencies count as MKD. Rows that existed before this migration are
+-- filled at the end of it, after a rate change `flask backfill-prices` recomputes them (see price_utils.py)
+CREATE TABLE IF NOT EXISTS ads.exchange_rates (
+    currency TEXT PRIMARY KEY,
+    rate_to_mkd NUMERIC NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO ads.exchange_rates (currency, rate_to_mkd)
+VALUES ('МКД', 1), ('ден', 1), ('€', 61.5), ('EUR', 61.5), ('ЕУР', 61.5)
+ON CONFLICT DO NOTHING;
+
+ALTER TABLE ads.ads ADD COLUMN IF NOT EXISTS price_value BIGINT;
+ALTER TABLE ads.ads ADD COLUMN IF NOT EXISTS price_mkd NUMERIC;
+ALTER TABLE ads.ads ADD COLUMN IF NOT EXISTS price_eur NUMERIC;
+
+-- More than 18 digits doesn't fit a bigint, such prices are typos and count as negotiable
+CREATE OR REPLACE FUNCTION ads.parse_price(price text) RETURNS bigint
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE WHEN price ~ '^[0-9]{1,18}$' THEN price::bigint END
+$$;
+
+CREATE OR REPLACE FUNCTION ads.rate_to_mkd(currency text) RETURNS numeric
+LANGUAGE sql STABLE PARALLEL SAFE AS $$
+    SELECT coalesce((SELECT rate_to_mkd FROM ads.exchange_rates r WHERE r.currency = $1), 1)
+$$;
+
+CREATE OR REPLACE FUNCTION ads.set_price_columns() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.price_value := ads.parse_price(NEW.price);
+    NEW.price_mkd := coalesce(NEW.price_value, 0) * ads.rate_to_mkd(NEW.currency);
+    NEW.price_eur := round(NEW.price_mkd / ads.rate_to_mkd('€'), 2);
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS ads_set_price_columns ON ads.ads;
+CREATE TRIGGER ads_set_price_columns BEFORE INSERT OR UPDATE OF price, currency ON ads.ads
+FOR EACH ROW EXECUTE FUNCTION ads.set_price_columns();
+
+-- (key, id) like the keyset pagination compares, both sort directions use the same index
+CREATE INDEX IF NOT EXISTS ads_price_mkd_idx ON ads.ads (price_mkd, id);
+CREATE INDEX IF NOT EXISTS ads_price_eur_idx ON ads.ads (price_eur, id);
+
+-- Existing rows, same conversion as the trigger. Price sort cursors and the price history (0009) never see a NULL
+UPDATE ads.ads
+SET price_value = ads.parse_price(price),
+    price_mkd = coalesce(ads.parse_price(price), 0) * ads.rate_to_mkd(currency),
+    price_eur = round(coalesce(ads.parse_price(price), 0) * ads.rate_to_mkd(currency) / ads.rate_to_mkd('€'), 2)
+WHERE price_mkd IS NULL;
+
+ALTER TABLE ads.ads ALTER COLUMN price_mkd SET NOT NULL;
+ALTER TABLE ads.ads ALTER COLUMN price_eur SET NOT NULL;
@@ -0,0 +1,37 @@
+-- Number of ads for every (category, location, store, price bucket) combination that exists (facet_utils.py).
+-- It is a few thousand rows, so counts for any combination of those filters are a small SUM ... GROUP BY instead
+-- of a scan of ads.ads. The scrapers' ad sink adds to it in the same statement that inserts ads, checkDeletedAds
+-- subtracts what it deletes
+
+-- Price buckets in MKD. "negotiable" is every non numeric price (По Договор), "1" is the placeholder price
+-- some sellers use, so both can be counted separately from real prices
+DROP FUNCTION IF EXISTS ads.price_bucket(text, text);  -- Computed from the price text before price_mkd existed
+CREATE OR REPLACE FUNCTION ads.price_bucket(price_value bigint, price_mkd numeric) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN price_value IS NULL THEN 'negotiable'
+        WHEN price_value = 1 THEN '1'
+        WHEN price_mkd < 1000 THEN '0-1000'
+        WHEN price_mkd < 5000 THEN '1000-5000'
+        WHEN price_mkd < 20000 THEN '5000-20000'
+        WHEN price_mkd < 100000 THEN '20000-100000'
+        WHEN price_mkd < 500000 THEN '100000-500000'
+        ELSE '500000+'
+    END
+$$;
+
+CREATE TABLE IF NOT EXISTS ads.facet_counts (
+    category TEXT NOT NULL,
+    location TEXT NOT NULL,
+    store TEXT NOT NULL,
+    price_bucket TEXT NOT NULL,
+    count BIGINT NOT NULL,
+    PRIMARY KEY (category, location, store, price_bucket)
+);
+
+-- First fill, later the counts are maintained incrementally (facet_utils.rebuild_facet_counts recounts them)
+INSERT INTO ads.facet_counts (category, location, store, price_bucket, count)
+SELECT coalesce(category, ''), coalesce(location, ''), store, ads.price_bucket(price_value, price_mkd), count(*)
+FROM ads.ads
+WHERE NOT EXISTS (SELECT 1 FROM ads.facet_counts)
+GROUP BY 1, 2, 3, 4;
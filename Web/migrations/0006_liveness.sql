@@ -0,0 +1,7 @@
+-- Liveness scheduling for main/checkDeletedAds.py. Never checked ads get -infinity, so they are due first.
+-- Adding a column with a constant default doesn't rewrite the table
+ALTER TABLE ads.ads ADD COLUMN IF NOT EXISTS last_checked_at TIMESTAMPTZ;
+ALTER TABLE ads.ads ADD COLUMN IF NOT EXISTS consecutive_ok INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE ads.ads ADD COLUMN IF NOT EXISTS next_check_at TIMESTAMPTZ NOT NULL DEFAULT '-infinity';
+
+CREATE INDEX IF NOT EXISTS ads_next_check_idx ON ads.ads (next_check_at, id);
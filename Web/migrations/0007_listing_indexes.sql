@@ -0,0 +1,21 @@
+-- Indexes for the listing queries (query_utils.apply_filters + keyset_page). Pages are ordered by (key, id) and
+-- seek past the cursor with a row comparison, so every index ends in the sort key and id: Postgres reads the
+-- first page straight from the index and stops after per_page + 1 rows, in either direction.
+-- Category, location and store are equality filters, they go first. Only the combinations the sidebar actually
+-- sends are covered, every extra index slows down the scrapers' inserts
+
+-- Newest / oldest without filters, also the search page when it's sorted by date
+CREATE INDEX IF NOT EXISTS ads_date_idx ON ads.ads (date, id);
+
+-- Newest / oldest within one category, location or store. The location one also serves the distinct locations
+-- list on the index page, the store one the incremental crawl's known links lookup
+CREATE INDEX IF NOT EXISTS ads_category_date_idx ON ads.ads (category, date, id);
+CREATE INDEX IF NOT EXISTS ads_location_date_idx ON ads.ads (location, date, id);
+CREATE INDEX IF NOT EXISTS ads_store_date_idx ON ads.ads (store, date, id);
+
+-- Cheapest / expensive within a category
+CREATE INDEX IF NOT EXISTS ads_category_price_idx ON ads.ads (category, price_mkd, id);
+
+-- Cheapest with "exclude negotiable": negotiable ads have price_mkd 0 and would all be skipped first
+-- in ads_price_mkd_idx, here they are left out of the index
+CREATE INDEX IF NOT EXISTS ads_priced_idx ON ads.ads (price_mkd, id) WHERE price_value IS NOT NULL;
@@ -0,0 +1,4 @@
+-- Hash of the normalized ad fields, computed by the scrapers' ad sink (main/ad_sink.py). A scraped ad whose hash
+-- matches the stored one is skipped, so re-scraping unchanged ads writes nothing. Rows from before this column
+-- have NULL and are rewritten once, the next time they are scraped
+ALTER TABLE ads.ads ADD COLUMN IF NOT EXISTS content_hash BYTEA;
@@ -0,0 +1,43 @@
+-- Append-only price history, one row per ad when it's first seen and one more every time its price changes.
+-- Written by triggers, so every path that writes ads.ads (the scrapers' upsert, backfills) is covered.
+-- No foreign key: the history of ads the sweeper deletes is kept
+CREATE TABLE IF NOT EXISTS ads.ad_price_history (
+    ad_id INTEGER NOT NULL,
+    recorded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    price_value BIGINT,  -- NULL for negotiable, like ads.price_value
+    price_mkd NUMERIC,  -- Converted with the rate of the moment it was recorded
+    currency TEXT
+);
+
+-- Rows are only ever appended with now(), so recorded_at follows the physical order and a BRIN index
+-- (a few pages for millions of rows) narrows "changes in the last N days" down to the last blocks of the table
+CREATE INDEX IF NOT EXISTS ad_price_history_recorded_brin ON ads.ad_price_history USING brin (recorded_at);
+-- One ad's series
+CREATE INDEX IF NOT EXISTS ad_price_history_ad_idx ON ads.ad_price_history (ad_id, recorded_at);
+
+CREATE OR REPLACE FUNCTION ads.record_price() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO ads.ad_price_history (ad_id, price_value, price_mkd, currency)
+    VALUES (NEW.id, NEW.price_value, NEW.price_mkd, NEW.currency);
+    RETURN NULL;
+END
+$$;
+
+-- AFTER triggers see the numeric columns ads_set_price_columns filled in. A rate change (backfill-prices) only
+-- moves price_mkd, that isn't a new price
+DROP TRIGGER IF EXISTS ads_price_history_insert ON ads.ads;
+CREATE TRIGGER ads_price_history_insert AFTER INSERT ON ads.ads
+FOR EACH ROW EXECUTE FUNCTION ads.record_price();
+
+DROP TRIGGER IF EXISTS ads_price_history_update ON ads.ads;
+CREATE TRIGGER ads_price_history_update AFTER UPDATE OF price, currency ON ads.ads
+FOR EACH ROW WHEN (OLD.price_value IS DISTINCT FROM NEW.price_value OR OLD.currency IS DISTINCT FROM NEW.currency)
+EXECUTE FUNCTION ads.record_price();
+
+-- Existing ads start their series at the date they were posted, oldest first to keep the BRIN order
+INSERT INTO ads.ad_price_history (ad_id, recorded_at, price_value, price_mkd, currency)
+SELECT id, date::timestamptz, price_value, price_mkd, currency
+FROM ads.ads
+WHERE NOT EXISTS (SELECT 1 FROM ads.ad_price_history)
+ORDER BY date, id;
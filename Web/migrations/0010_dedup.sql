@@ -0,0 +1,44 @@
+-- Near-duplicate clusters for ads cross-posted on several stores, filled by main/dedup.py during ingestion.
+-- cluster_id is NULL for an ad without copies, otherwise every member of a cluster (the first posting included)
+-- holds the id of the first posting. Listings show the rows WHERE cluster_id IS NULL OR cluster_id = id
+ALTER TABLE ads.ads ADD COLUMN IF NOT EXISTS cluster_id INTEGER;
+
+-- MinHash signature of every ad, compared to confirm a candidate
+CREATE TABLE IF NOT EXISTS ads.ad_signatures (
+    ad_id INTEGER PRIMARY KEY REFERENCES ads.ads (id) ON DELETE CASCADE,
+    signature INTEGER[] NOT NULL
+);
+
+-- LSH buckets, one row per band of every signature. Ads sharing a (band, bucket) are candidates, found through
+-- the primary key without comparing against the whole table
+CREATE TABLE IF NOT EXISTS ads.ad_lsh_buckets (
+    band SMALLINT NOT NULL,
+    bucket BIGINT NOT NULL,
+    ad_id INTEGER NOT NULL REFERENCES ads.ads (id) ON DELETE CASCADE,
+    PRIMARY KEY (band, bucket, ad_id)
+);
+-- Replacing the buckets of a changed ad, and the cascade when the sweeper deletes one
+CREATE INDEX IF NOT EXISTS ad_lsh_buckets_ad_idx ON ads.ad_lsh_buckets (ad_id);
+
+-- The newest-first listing without duplicates. Filtered listings use the 0007 indexes and drop the copies
+-- on the way, a few rows per page
+CREATE INDEX IF NOT EXISTS ads_listed_date_idx ON ads.ads (date, id) WHERE cluster_id IS NULL OR cluster_id = id;
+-- Members of one cluster
+CREATE INDEX IF NOT EXISTS ads_cluster_idx ON ads.ads (cluster_id) WHERE cluster_id IS NOT NULL;
+
+-- When the first posting of a cluster is deleted (expired on its store), the next oldest copy takes its place,
+-- otherwise the remaining copies would disappear from the listings with it
+CREATE OR REPLACE FUNCTION ads.promote_cluster_head() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE ads.ads SET cluster_id = heads.new_id
+    FROM (SELECT min(id) AS new_id FROM ads.ads WHERE cluster_id = OLD.id) AS heads
+    WHERE ads.ads.cluster_id = OLD.id AND heads.new_id IS NOT NULL;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS ads_promote_cluster_head ON ads.ads;
+CREATE TRIGGER ads_promote_cluster_head AFTER DELETE ON ads.ads
+FOR EACH ROW WHEN (OLD.cluster_id = OLD.id)
+EXECUTE FUNCTION ads.promote_cluster_head();
@@ -0,0 +1,43 @@
+-- Seller lookup by phone number. phone_keys holds the numbers of an ad as digits with the country code
+-- (078 123 456 -> 38978123456), the same keys as Web/phone_utils.phone_key(). Numbers saved by older scraper
+-- versions (00389..., +389..., foreign numbers) get the same key as the current format, nothing is rewritten
+CREATE OR REPLACE FUNCTION ads.phone_key(phone TEXT) RETURNS TEXT
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    international BOOLEAN := left(btrim(phone), 1) = '+';
+    digits TEXT := regexp_replace(phone, '\D', '', 'g');
+BEGIN
+    IF left(digits, 2) = '00' THEN
+        digits := substr(digits, 3);
+        international := true;
+    END IF;
+
+    IF international THEN
+        -- Often written as +389 (0)78 ...
+        IF left(digits, 4) = '3890' THEN
+            digits := '389' || substr(digits, 5);
+        END IF;
+        RETURN CASE WHEN length(digits) BETWEEN 8 AND 15 THEN digits END;
+    END IF;
+
+    IF left(digits, 3) = '389' AND length(digits) = 11 THEN
+        RETURN digits;
+    END IF;
+    IF left(digits, 1) = '0' THEN
+        digits := substr(digits, 2);
+    END IF;
+    RETURN CASE WHEN length(digits) = 8 THEN '389' || digits END;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION ads.phone_keys(phones TEXT[]) RETURNS TEXT[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT coalesce(array_agg(DISTINCT key) FILTER (WHERE key IS NOT NULL), '{}')
+    FROM unnest(phones) AS phone, ads.phone_key(phone) AS key
+$$;
+
+-- Rewrites the table once, like the search columns in 0002
+ALTER TABLE ads.ads ADD COLUMN IF NOT EXISTS phone_keys TEXT[] GENERATED ALWAYS AS (ads.phone_keys(phone)) STORED;
+
+-- phone_keys @> ARRAY['38978123456'] finds a seller's ads without scanning the table
+CREATE INDEX IF NOT EXISTS ads_phone_keys_idx ON ads.ads USING gin (phone_keys);
@@ -0,0 +1,29 @@
+-- ads.facet_counts counts the ads the listings show: cross-posted copies (0010) are left out, like apply_filters
+-- leaves them out, so the sidebar numbers match the listing totals. The sink and dedup.py keep it that way,
+-- this migration recounts once and makes the head promotion count the copy that becomes listed
+DELETE FROM ads.facet_counts;
+INSERT INTO ads.facet_counts (category, location, store, price_bucket, count)
+SELECT coalesce(category, ''), coalesce(location, ''), store, ads.price_bucket(price_value, price_mkd), count(*)
+FROM ads.ads WHERE cluster_id IS NULL OR cluster_id = id
+GROUP BY 1, 2, 3, 4;
+
+-- The deleting statement subtracts the deleted first posting, the promoted copy is added here
+CREATE OR REPLACE FUNCTION ads.promote_cluster_head() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    head ads.ads%ROWTYPE;
+BEGIN
+    SELECT * INTO head FROM ads.ads WHERE cluster_id = OLD.id ORDER BY id LIMIT 1;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE ads.ads SET cluster_id = head.id WHERE cluster_id = OLD.id;
+
+    INSERT INTO ads.facet_counts (category, location, store, price_bucket, count)
+    VALUES (coalesce(head.category, ''), coalesce(head.location, ''), head.store,
+            ads.price_bucket(head.price_value, head.price_mkd), 1)
+    ON CONFLICT (category, location, store, price_bucket) DO UPDATE SET count = ads.facet_counts.count + 1;
+    RETURN NULL;
+END
+$$;
@@ -0,0 +1,4 @@
+-- Title-only searches (search_utils.apply_search with fields=('title',)) match typos against the transliterated
+-- title instead of search_text, which also holds the description. Same expression as in the query, so <% is
+-- served by this index
+CREATE INDEX IF NOT EXISTS ads_title_trgm_idx ON ads.ads USING gin (ads.translit_mk(title) gin_trgm_ops);
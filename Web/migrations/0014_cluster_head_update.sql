@@ -0,0 +1,9 @@
+-- A first posting can also leave its cluster without being deleted: edited so it no longer matches its copies,
+-- main/dedup.py sets its cluster_id to NULL (or to an older cluster). The copies would keep pointing at an ad
+-- that isn't a head any more and disappear from the listings and facet_counts. The next oldest copy takes its
+-- place, the same way as on DELETE (0012). The statement changing cluster_id counts the old head's own change,
+-- the promoted copy is added by the function
+DROP TRIGGER IF EXISTS ads_promote_cluster_head_on_update ON ads.ads;
+CREATE TRIGGER ads_promote_cluster_head_on_update AFTER UPDATE OF cluster_id ON ads.ads
+FOR EACH ROW WHEN (OLD.cluster_id = OLD.id AND NEW.cluster_id IS DISTINCT FROM NEW.id)
+EXECUTE FUNCTION ads.promote_cluster_head();
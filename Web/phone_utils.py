@@ -0,0 +1,58 @@
+import re
+
+# One phone number normalization for every store. The scrapers save normalize_phone() in ads.phone, the seller
+# lookup compares phone_key(), the same function as ads.phone_key() in migrations/0011_seller_phones.sql.
+# Ads saved with an older format get the same key, so they don't need rewriting. tests/test_phone_utils.py checks
+# that the two agree.
+#
+#   078 123 456, 078/123-456, +389 78 123 456, 00389 (0)78 123 456, 78123456  ->  key 38978123456, "078 123 456"
+#   +30 694 123 4567, 0030 694 123 4567                                        ->  key 306941234567, "+306941234567"
+MK_COUNTRY_CODE = '389'
+MK_LOCAL_DIGITS = 8  # Without the leading 0
+MIN_DIGITS = 8  # E.164 limits for foreign numbers, with the country code
+MAX_DIGITS = 15
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def phone_key(phone):
+    """Digits with the country code and without the trunk 0, or None if it isn't a phone number"""
+    if not phone:
+        return None
+    international = phone.strip().startswith('+')
+    digits = _NON_DIGITS.sub('', phone)
+    if digits.startswith('00'):
+        digits, international = digits[2:], True
+
+    if international:
+        # Often written as +389 (0)78 ...
+        if digits.startswith(MK_COUNTRY_CODE + '0'):
+            digits = MK_COUNTRY_CODE + digits[len(MK_COUNTRY_CODE) + 1:]
+        return digits if MIN_DIGITS <= len(digits) <= MAX_DIGITS else None
+
+    if digits.startswith(MK_COUNTRY_CODE) and len(digits) == len(MK_COUNTRY_CODE) + MK_LOCAL_DIGITS:
+        return digits
+    if digits.startswith('0'):
+        digits = digits[1:]
+    return MK_COUNTRY_CODE + digits if len(digits) == MK_LOCAL_DIGITS else None
+
+
+def normalize_phone(phone):
+    """Display format: 0XX XXX XXX for Macedonian numbers, +<digits> for foreign ones, None if invalid"""
+    key = phone_key(phone)
+    if key is None:
+        return None
+    if key.startswith(MK_COUNTRY_CODE) and len(key) == len(MK_COUNTRY_CODE) + MK_LOCAL_DIGITS:
+        local = '0' + key[len(MK_COUNTRY_CODE):]
+        return f"{local[:3]} {local[3:6]} {local[6:]}"
+    return '+' + key
+
+
+def normalize_phones(phones, excluded=()):
+    """Normalized, de-duplicated numbers of an ad in their original order, invalid and excluded ones dropped"""
+    normalized = []
+    for phone in phones:
+        number = normalize_phone(phone)
+        if number and number not in excluded and number not in normalized:
+            normalized.append(number)
+    return normalized
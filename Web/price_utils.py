@@ -0,0 +1,121 @@
+import click
+from sqlalchemy import text
+from extensions import db
+from cache_utils import bump_generation
+from facet_utils import rebuild_facet_counts
+from thumbnail_utils import thumbnail_url
+
+# price_value / price_mkd / price_eur are kept up to date by a trigger from price and currency, using the rates in
+# ads.exchange_rates (migrations/0004_prices.sql). After a rate change all rows are recomputed here
+EUR_CURRENCIES = ('€', 'EUR', 'ЕУР')  # Spellings the stores use, all share the EUR rate
+BACKFILL_BATCH_SIZE = 5000
+
+SET_RATE_SQL = """
+    INSERT INTO ads.exchange_rates (currency, rate_to_mkd) VALUES (:currency, :rate)
+    ON CONFLICT (currency) DO UPDATE SET rate_to_mkd = EXCLUDED.rate_to_mkd, updated_at = now()
+"""
+# Same conversion as the ads_set_price_columns trigger. Only the numeric columns are set, so neither the price
+# trigger nor the price history triggers (UPDATE OF price, currency) fire: a new rate is not a price change
+BACKFILL_SQL = """
+    WITH batch AS (
+        SELECT id FROM ads.ads WHERE id > :last_id ORDER BY id LIMIT :batch_size
+    )
+    UPDATE ads.ads AS a
+    SET price_value = ads.parse_price(a.price),
+        price_mkd = coalesce(ads.parse_price(a.price), 0) * ads.rate_to_mkd(a.currency),
+        price_eur = round(coalesce(ads.parse_price(a.price), 0) * ads.rate_to_mkd(a.currency) / ads.rate_to_mkd('€'), 2)
+    FROM batch WHERE a.id = batch.id
+    RETURNING a.id
+"""
+
+
+# Price history is written by triggers (migrations/0009_price_history.sql), these only read it
+DEFAULT_DROP_DAYS = 7
+MAX_DROP_DAYS = 90
+
+# Served from ad_price_history_ad_idx, the rows of one ad in order
+PRICE_SERIES_SQL = """
+    SELECT recorded_at, price_value, price_mkd, currency FROM ads.ad_price_history
+    WHERE ad_id = :ad_id ORDER BY recorded_at
+"""
+# Changes in the window come from the BRIN index, each is compared with the ad's previous price through the
+# (ad_id, recorded_at) index. Negotiable prices on either side aren't drops
+PRICE_DROPS_SQL = """
+    SELECT c.ad_id, c.recorded_at, previous.price_value AS old_price, c.price_value AS new_price, c.currency,
+           round(100 * (1 - c.price_mkd / previous.price_mkd), 1) AS drop_percent
+    FROM ads.ad_price_history AS c
+    CROSS JOIN LATERAL (
+        SELECT h.price_value, h.price_mkd FROM ads.ad_price_history AS h
+        WHERE h.ad_id = c.ad_id AND h.recorded_at < c.recorded_at
+        ORDER BY h.recorded_at DESC LIMIT 1
+    ) AS previous
+    WHERE c.recorded_at >= now() - make_interval(days => :days)
+      AND c.price_value IS NOT NULL AND previous.price_value IS NOT NULL
+      AND c.price_mkd < previous.price_mkd
+"""
+DROPPED_ADS_SQL = f"""
+    SELECT d.*, a.title, a.link, a.image_url, a.location, a.store
+    FROM ({PRICE_DROPS_SQL}) AS d JOIN ads.ads AS a ON a.id = d.ad_id
+    ORDER BY drop_percent DESC, d.recorded_at DESC LIMIT :limit
+"""
+
+
+def _drop_dict(row):
+    return {
+        'date': row.recorded_at.isoformat(),
+        'old_price': row.old_price,
+        'new_price': row.new_price,
+        'currency': row.currency,
+        'drop_percent': float(row.drop_percent),
+    }
+
+
+def price_history(ad_id, days=DEFAULT_DROP_DAYS):
+    """{'series': [...], 'drops': [...]} of one ad, drops only from the last `days` days"""
+    series = db.session.execute(text(PRICE_SERIES_SQL), {'ad_id': ad_id}).all()
+    drops = db.session.execute(text(PRICE_DROPS_SQL + " AND c.ad_id = :ad_id ORDER BY c.recorded_at"),
+                               {'ad_id': ad_id, 'days': days}).all()
+    return {
+        'adid': ad_id,
+        'series': [{'date': row.recorded_at.isoformat(), 'price': row.price_value, 'currency': row.currency,
+                    'price_mkd': float(row.price_mkd) if row.price_mkd is not None else None} for row in series],
+        'drops': [_drop_dict(row) for row in drops],
+    }
+
+
+def recent_price_drops(days=DEFAULT_DROP_DAYS, limit=50):
+    """Ads whose price went down in the last `days` days, biggest drop first"""
+    rows = db.session.execute(text(DROPPED_ADS_SQL), {'days': days, 'limit': limit}).all()
+    return [dict(_drop_dict(row), adid=row.ad_id, adtitle=row.title, adlink=row.link, adimage=row.image_url,
+                 adthumb=thumbnail_url(row.ad_id, row.image_url), adlocation=row.location, adstore=row.store)
+            for row in rows]
+
+
+def backfill_prices(batch_size=BACKFILL_BATCH_SIZE):
+    """Recompute the numeric price columns in id order, one committed batch at a time. Returns the rows updated"""
+    last_id, total = 0, 0
+    while True:
+        ids = db.session.execute(text(BACKFILL_SQL), {'last_id': last_id, 'batch_size': batch_size}).scalars().all()
+        db.session.commit()
+        if not ids:
+            return total
+        last_id = max(ids)
+        total += len(ids)
+        click.echo(f"Updated {total} ads (up to id {last_id})")
+
+
+@click.command('backfill-prices')
+@click.option('--eur-rate', type=float, help="New MKD per EUR rate, stored before recomputing")
+@click.option('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+def backfill_prices_command(eur_rate, batch_size):
+    """Recompute price_value / price_mkd / price_eur of existing ads (flask backfill-prices)"""
+    if eur_rate:
+        for currency in EUR_CURRENCIES:
+            db.session.execute(text(SET_RATE_SQL), {'currency': currency, 'rate': eur_rate})
+        db.session.commit()
+    total = backfill_prices(batch_size=batch_size)
+    # Price buckets depend on price_mkd, recount them from the updated rows
+    rebuild_facet_counts()
+    # Cached listings, price sorts and /facets hold the old prices
+    bump_generation()
+    click.echo(f"Done, {total} ads updated.")
@@ -0,0 +1,168 @@
+import base64
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import Text, literal_column, or_, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY
+from db_models import Ad
+from thumbnail_utils import thumbnail_url
+
+EUR_CURRENCIES = ('€', 'EUR')  # Values the client sends when prices are shown in EUR
+
+DEFAULT_PER_PAGE = 48
+MAX_PER_PAGE = 100
+
+# Columns the ad cards show. Description is by far the largest column, it is only loaded by /ad_details
+LIST_COLUMNS = (Ad.id, Ad.link, Ad.title, Ad.price, Ad.currency, Ad.category, Ad.image_url, Ad.phone, Ad.location,
+                Ad.date, Ad.store, Ad.cluster_id)
+
+# Request fields apply_filters reads, together with the sort they identify a listing (used as cache key)
+FILTER_FIELDS = ('category', 'location', 'store', 'exclude_negotiable', 'exclude_price_1', 'currency',
+                 'min_price', 'max_price', 'show_duplicates')
+
+# sort name -> (key column, descending), every sort is tie-broken by id so the cursor is unique
+SORTS = {
+    'newest': (Ad.date, True),
+    'oldest': (Ad.date, False),
+    'cheapest': (Ad.price_mkd, False),
+    'expensive': (Ad.price_mkd, True),
+}
+DEFAULT_SORT = 'newest'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _to_float(value):
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def apply_filters(query, filters):
+    """Apply category, location, store and price range filters from a request dict"""
+    category = (filters.get('category') or '').strip()
+    if category:
+        query = query.filter(Ad.category == category)
+
+    location = (filters.get('location') or '').strip()
+    if location:
+        query = query.filter(Ad.location == location)
+
+    store = (filters.get('store') or '').strip()
+    if store:
+        query = query.filter(Ad.store == store)
+
+    if filters.get('exclude_negotiable'):
+        query = query.filter(Ad.price_value.isnot(None))
+
+    if filters.get('exclude_price_1'):
+        query = query.filter(Ad.price_value.is_distinct_from(1))
+
+    # Range is given in the currency the user has selected in the sidebar, both columns are indexed
+    price_column = Ad.price_eur if filters.get('currency') in EUR_CURRENCIES else Ad.price_mkd
+    min_price = _to_float(filters.get('min_price'))
+    max_price = _to_float(filters.get('max_price'))
+    if min_price is not None:
+        query = query.filter(price_column >= min_price)
+    if max_price is not None:
+        query = query.filter(price_column <= max_price)
+
+    # Cross-posted copies share the cluster_id of the first posting, only that one is listed. Same predicate as
+    # the partial index ads_listed_date_idx
+    if not filters.get('show_duplicates'):
+        query = query.filter(or_(Ad.cluster_id.is_(None), Ad.cluster_id == Ad.id))
+
+    return query
+
+
+# Generated from ads.phone (migrations/0011_seller_phones.sql), not mapped on Ad like the search columns
+phone_keys = literal_column('ads.ads.phone_keys', type_=ARRAY(Text))
+
+
+def apply_seller(query, key):
+    """Ads with the phone key (phone_utils.phone_key) among their numbers, served by the GIN index"""
+    return query.filter(phone_keys.contains([key]))
+
+
+def list_query():
+    """Query for listings that returns LIST_COLUMNS rows instead of Ad objects, nothing to hydrate"""
+    return Ad.query.with_entities(*LIST_COLUMNS)
+
+
+def listing_dict(row):
+    """Card fields of a LIST_COLUMNS row, the same keys as Ad.to_dict() without addesc"""
+    return {
+        'adid': row.id,
+        'adlink': row.link,
+        'adtitle': row.title,
+        'adprice': row.price,
+        'adcurrency': row.currency,
+        'adcategory': row.category,
+        'adimage': row.image_url,
+        'adthumb': thumbnail_url(row.id, row.image_url),
+        'adphone': row.phone or [],
+        'adlocation': row.location,
+        'addate': row.date.strftime("%d.%m.%Y") if row.date else "N/A",
+        'adstore': row.store,
+        'adcluster': row.cluster_id,
+    }
+
+
+def encode_cursor(value, ad_id):
+    if isinstance(value, date):
+        value = value.isoformat()
+    elif value is not None:
+        value = str(value)  # Decimal from price_mkd
+    raw = json.dumps([value, ad_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        value, ad_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        ad_id = int(ad_id)
+        if sort in ('newest', 'oldest'):
+            value = date.fromisoformat(value)
+        elif sort in ('cheapest', 'expensive'):
+            value = Decimal(value)  # Compared to a numeric column, a float would stop the index from being used
+        else:
+            value = float(value)
+    except (ValueError, TypeError, InvalidOperation, json.JSONDecodeError, UnicodeError):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    return value, ad_id
+
+
+def keyset_page(query, sort=None, cursor=None, per_page=DEFAULT_PER_PAGE, sorts=SORTS, default_sort=DEFAULT_SORT):
+    """Return (rows, next_cursor) for one page, seeking past the cursor instead of using OFFSET"""
+    if sort not in sorts:
+        sort = default_sort
+    key, descending = sorts[sort]
+
+    if cursor:
+        value, ad_id = decode_cursor(cursor, sort)
+        # Row comparison matches a (key, id) index, so deep pages cost the same as the first one
+        if descending:
+            query = query.filter(tuple_(key, Ad.id) < tuple_(value, ad_id))
+        else:
+            query = query.filter(tuple_(key, Ad.id) > tuple_(value, ad_id))
+
+    if descending:
+        query = query.order_by(key.desc(), Ad.id.desc())
+    else:
+        query = query.order_by(key.asc(), Ad.id.asc())
+
+    # One extra row tells us if there is a next page without a COUNT. Rows need an id column (see list_query)
+    rows = query.add_columns(key.label('sort_key')).limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    next_cursor = None
+    if has_next and rows:
+        next_cursor = encode_cursor(rows[-1].sort_key, rows[-1].id)
+
+    return rows, next_cursor
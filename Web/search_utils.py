@@ -0,0 +1,73 @@
+import re
+from sqlalchemy import Float, cast, func, literal, literal_column, or_
+
+# Same translitmap as index.js and ads.translit_mk (migrations/0002_search.sql), multi-character sequences have to be
+# replaced first
+TRANSLIT_MULTI = [
+    ('gj', 'ѓ'), ('zh', 'ж'), ('dz', 'ѕ'), ('lj', 'љ'), ('nj', 'њ'),
+    ('kj', 'ќ'), ('ch', 'ч'), ('dj', 'џ'), ('sh', 'ш'),
+]
+TRANSLIT_SINGLE = ('abvgdezijklmnoprstufhc', 'абвгдезијклмнопрстуфхц')
+
+
+# Columns are generated by migrations/0002_search.sql, they are not mapped on Ad so list queries don't load them
+search_vector = literal_column('ads.ads.search_vector')
+search_text = literal_column('ads.ads.search_text')
+# search_text without the description, for title-only searches. Indexed by migrations/0013_title_trigram.sql
+title_text = func.ads.translit_mk(literal_column('ads.ads.title'))
+
+MAX_TERMS = 10
+MIN_SIMILARITY_TERM = 4  # Shorter terms only match through the tsvector prefix search
+
+
+def transliterate(value):
+    # Python twin of ads.translit_mk, used to normalize the query before it is built into a tsquery. Kept in sync by
+    # tests/test_search_utils.py
+    result = (value or '').lower()
+    for lat, cyr in TRANSLIT_MULTI:
+        result = result.replace(lat, cyr)
+    return result.translate(str.maketrans(*TRANSLIT_SINGLE))
+
+
+def parse_terms(query):
+    # Client sends comma separated phrases, the index works on single words
+    return re.findall(r'[^\W_]+', transliterate(query))[:MAX_TERMS]
+
+
+def build_tsquery(terms, match='every', fields=('title', 'desc')):
+    """Build a prefix tsquery string like 'ајпхоне:*A & 15:*A' from normalized words"""
+    # A = title, B = description (setweight in migrations/0002_search.sql)
+    weights = ''
+    if 'title' in fields and 'desc' not in fields:
+        weights = 'A'
+    elif 'desc' in fields and 'title' not in fields:
+        weights = 'B'
+
+    operator = ' | ' if match == 'some' else ' & '
+    return operator.join(f"{term}:*{weights}" for term in terms)
+
+
+def apply_search(query, search, match='every', fields=('title', 'desc')):
+    """Filter query to ads matching search, returns (query, rank expression) or (None, None) for an empty search"""
+    terms = parse_terms(search)
+    if not terms:
+        return None, None
+
+    # Terms are already transliterated, so the weight letters in the tsquery stay latin
+    tsquery = func.to_tsquery('simple', build_tsquery(terms, match, fields))
+    normalized = literal(' '.join(terms))
+
+    condition = search_vector.op('@@')(tsquery)
+    # The tsquery weights restrict the prefix search to the selected fields, the trigram side needs its own column
+    similarity_text = title_text if 'desc' not in fields else search_text
+    # Trigram word similarity catches typos the prefix search misses, only for longer terms
+    if all(len(term) >= MIN_SIMILARITY_TERM for term in terms):
+        # <% is the indexable form of word_similarity >= pg_trgm.word_similarity_threshold (0.6)
+        condition = or_(condition, normalized.op('<%')(similarity_text))
+
+    # ts_rank_cd and word_similarity are real (float4). The keyset cursor keeps the rank as a Python float and
+    # compares it as double precision, which isn't the same number for a float4 (0.3 vs 0.30000001192...). Ties
+    # at a page boundary would be dropped or repeated, so the sort key itself is double precision
+    rank = cast(func.ts_rank_cd(search_vector, tsquery) + func.word_similarity(normalized, similarity_text),
+                Float)
+    return query.filter(condition), rank
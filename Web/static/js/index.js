@@ -1,18 +1,24 @@
-// Store data in memory to avoid storage limits
-window.adsCache = [];
+// Thumbnail widths /thumb renders, same as THUMBNAIL_WIDTHS in thumbnail_utils.py
+const THUMBNAIL_WIDTHS = [160, 320, 640];
+const THUMBNAIL_DEFAULT_WIDTH = 320;
 
 // Main AdsManager class - orchestrates the other components
 class AdsManager {
     constructor() {
-        this.allAds = [];
         this.currentPage = this.getInitialPage();
         this.adsPerPage = 48;
         this.selectedCategory = null;
         this.currentSort = null;
-        this.filteredAds = [];
         this.matchMethod = "every";
         this.searchTerms = [];
         this.currentCurrency = "MKD";
+
+        // Server-side paging state, pageCursors[n - 1] is the cursor that loads page n
+        this.pageCursors = [null];
+        this.pageCache = {};
+        this.totalAds = 0;
+        this.pageRequestId = 0;
+        this.descriptions = {}; // ad id -> description, loaded by /ad_details for the list view
         
         // CSRF token for POST requests
         const csrfToken = document.querySelector('meta[name="csrf-token"]').content;
@@ -32,7 +38,7 @@ class AdsManager {
         // Setup and initialize
         this.setupEventListeners();
         this.fetchCategories();
-        this.fetchAllAds();
+        this.handleSearch(true);
     }
     
     getInitialPage() {
@@ -63,75 +69,131 @@ class AdsManager {
         });
     }
 
-    precomputePrices(targetCurrency) {
-        // Always recompute prices on initial load
-        if (targetCurrency === this.currentCurrency && this.initialLoadComplete) return;
-    
-        this.currentCurrency = targetCurrency; // Update the current currency
-        this.initialLoadComplete = true; // Mark initial load as complete
-    
-        this.allAds.forEach(ad => {
-            // Ensure convertedPrices exists
-            ad.convertedPrices = ad.convertedPrices || {};
-    
-            // Convert the ad price to the target currency and store it
-            ad.convertedPrices[targetCurrency] = this.filterManager.convertPrice(
-                ad.adprice,
-                ad.adcurrency,
-                targetCurrency
-            );
+    // Filters the server applies for /fetch_ads_page and /search
+    getServerFilters() {
+        const checkboxes = this.elements.checkboxes;
+        return {
+            category: this.selectedCategory || null,
+            location: this.filterManager.selectedLocation || null,
+            sort: this.currentSort,
+            currency: this.uiManager.currentCurrency,
+            min_price: this.elements.priceSelector.minPrice.value || null,
+            max_price: this.elements.priceSelector.maxPrice.value || null,
+            exclude_negotiable: !!(checkboxes.podogovor && checkboxes.podogovor.checked),
+            exclude_price_1: !!(checkboxes.price1 && checkboxes.price1.checked),
+        };
+    }
+
+    hasSearchTerms() {
+        return this.searchTerms.length > 0 && this.searchTerms[0] !== '';
+    }
+
+    resetPages() {
+        this.pageCursors = [null];
+        this.pageCache = {};
+        this.totalAds = 0;
+        this.descriptions = {};
+    }
+
+    async fetchAdsPage(cursor) {
+        // Search terms are matched and ranked by the server's full-text index
+        const searching = this.hasSearchTerms();
+        const response = await fetch(searching ? '/search' : '/fetch_ads_page', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': this.csrfToken,
+                'X-CSP-Nonce': this.nonce
+            },
+            body: JSON.stringify({
+                ...this.getServerFilters(),
+                ...(searching ? this.searchManager.getSearchParams(this.searchTerms) : {}),
+                cursor: cursor,
+                per_page: this.adsPerPage,
+                nonce: this.nonce
+            })
         });
+
+        if (!response.ok) {
+            throw new Error('Network response was not ok');
+        }
+
+        return response.json();
+    }
+
+    // Keyset pages can't be jumped to directly, so walk forward from the first page that isn't loaded yet
+    async loadPage(page) {
+        const requestId = this.pageRequestId;
+
+        for (let current = 1; current <= page; current++) {
+            if (this.pageCache[current]) continue;
+
+            const cursor = this.pageCursors[current - 1];
+            if (cursor === undefined) return []; // Past the last page
+
+            const data = await this.fetchAdsPage(cursor);
+            // Filters changed while this request was in flight
+            if (requestId !== this.pageRequestId) return null;
+
+            if (data.total !== null && data.total !== undefined) {
+                this.totalAds = data.total;
+            }
+            this.pageCache[current] = data.ads;
+            if (data.next_cursor) {
+                this.pageCursors[current] = data.next_cursor;
+            }
+        }
+
+        return this.pageCache[page];
     }
 
-    async fetchAllAds() {
+    getTotalPages() {
+        return Math.max(1, Math.ceil(this.totalAds / this.adsPerPage));
+    }
+
+    // Ad counts per category and location for the current filters, the server keeps them precomputed
+    async fetchFacets() {
         try {
-            if (window.adsCache.length > 0) {
-                this.allAds = window.adsCache;
-            } else {
-                const response = await fetch('/fetch_ads', {
-                    method: 'POST',
-                    headers: { 
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': this.csrfToken,
-                        'X-CSP-Nonce': this.nonce
-                    },
-                    body: JSON.stringify({ 
-                        category: null,
-                        nonce: this.nonce
-                    })
-                });
-    
-                if (!response.ok) {
-                    throw new Error('Network response was not ok');
-                }
-    
-                this.allAds = await response.json();
-    
-                this.allAds = this.allAds.map(ad => {
-                    ad.adprice = Number(ad.adprice);
+            const response = await fetch('/facets', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': this.csrfToken,
+                    'X-CSP-Nonce': this.nonce
+                },
+                body: JSON.stringify({
+                    ...this.getServerFilters(),
+                    nonce: this.nonce
+                })
+            });
 
-                    if (typeof ad.adprice !== 'number' /* || !ad.adcurrency */) {
-                        console.error("Invalid ad:", ad);
-                        return null;
-                    }
-                    // Initialize convertedPrices if it doesn't exist
-                    ad.convertedPrices = ad.convertedPrices || {};
-                    return ad;
-                }).filter(ad => ad !== null);
-    
-                // Store ads in memory
-                window.adsCache = this.allAds;
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
             }
-    
-            // Precompute prices for the default currency
-            this.precomputePrices(this.currentCurrency);
-            this.handleSearch(true);
+
+            this.facets = await response.json();
+            this.updateFacetCounts();
         } catch (error) {
-            console.error('Error fetching ads:', error);
-            this.elements.adsGrid.innerHTML = '<p>Error loading ads. Please try again later.</p>';
+            console.error('Error fetching facets:', error);
         }
     }
 
+    // Counts go into data-count (shown by CSS), so button text used by the sidebar search stays the same
+    updateFacetCounts() {
+        if (!this.facets) return;
+
+        document.querySelectorAll('.category-btn').forEach(btn => {
+            if (btn.dataset.category) {
+                btn.dataset.count = this.facets.category[btn.dataset.category] || 0;
+            }
+        });
+        document.querySelectorAll('.location-btn').forEach(btn => {
+            if (btn.dataset.location) {
+                btn.dataset.count = this.facets.location[btn.dataset.location] || 0;
+            }
+        });
+    }
+
     // Need to fetch categories from server-side
     async fetchCategories() {
         try {
@@ -181,19 +243,22 @@ class AdsManager {
         
         // Re-attach event listeners
         this.uiManager.setupCategoryListeners();
+        this.updateFacetCounts();
     }
     
     handleSearch(preservePage = false) {
         this.uiManager.showSearchLoading();
-        setTimeout(() => {
+        setTimeout(async () => {
             this.searchTerms = this.searchManager.parseSearchTerms();
-            this.filteredAds = this.filterManager.getFilteredAds(this.allAds, this.searchTerms);
+            this.pageRequestId++;
+            this.resetPages();
+            this.fetchFacets();
 
             if (!preservePage) {
                 this.currentPage = 1;
             }
 
-            this.displayAds();
+            await this.displayAds();
             this.uiManager.hideSearchLoading();
         }, 150);
     }
@@ -201,7 +266,7 @@ class AdsManager {
     handlePageChange(newPage, shouldScrollToTop = false) {
         this.currentPage = newPage;
         this.urlManager.updateUrl(newPage);
-        this.displayAds(); // No need to fetch again
+        this.displayAds(); // Served from pageCache if the page was already loaded
 
         if (shouldScrollToTop) {
         this.uiManager.scrollToTop();
@@ -209,16 +274,60 @@ class AdsManager {
     }
     
     
-    displayAds() {
-        const start = (this.currentPage - 1) * this.adsPerPage;
-        const end = start + this.adsPerPage;
-        const pageAds = this.filteredAds.slice(start, end);
+    async displayAds() {
+        let pageAds;
+        try {
+            pageAds = await this.loadPage(this.currentPage);
+        } catch (error) {
+            console.error('Error fetching ads:', error);
+            this.elements.adsGrid.innerHTML = '<p>Error loading ads. Please try again later.</p>';
+            return;
+        }
+        // A newer request replaced this one
+        if (pageAds === null) return;
         
         this.elements.adsGrid.innerHTML = pageAds.length ? 
             pageAds.map(ad => this.uiManager.createAdHTML(ad)).join('') : 
             '<p>No ads for this category.</p>';
             
         this.paginationManager.updatePagination();
+
+        if (this.uiManager.currentView !== 'grid') {
+            this.loadDescriptions(pageAds);
+        }
+    }
+
+    // Listings only carry the card fields, the list view gets the descriptions of the whole page in one request
+    async loadDescriptions(ads) {
+        const missing = ads.map(ad => ad.adid).filter(id => !(id in this.descriptions));
+        if (missing.length) {
+            try {
+                const response = await fetch('/ad_details', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'X-CSRFToken': this.csrfToken,
+                        'X-CSP-Nonce': this.nonce
+                    },
+                    body: JSON.stringify({ ids: missing })
+                });
+                if (!response.ok) {
+                    throw new Error('Network response was not ok');
+                }
+                const data = await response.json();
+                data.ads.forEach(ad => { this.descriptions[ad.adid] = ad.addesc; });
+            } catch (error) {
+                console.error('Error fetching ad details:', error);
+                return;
+            }
+        }
+
+        ads.forEach(ad => {
+            const element = this.elements.adsGrid.querySelector(`.ad-description-text[data-ad-id="${ad.adid}"]`);
+            if (element) {
+                element.textContent = this.descriptions[ad.adid] ?? '';
+            }
+        });
     }
 }
 
@@ -290,470 +399,24 @@ class SearchManager {
         return this.elements.searchInput.value.trim().toLowerCase().split(',').map(term => term.trim());
     }
     
-    // Transliteration for multilingual search
-    transliterate(text) {
-        const translitmap = {
-            'a': 'а', 'b': 'б', 'v': 'в', 'g': 'г', 'd': 'д',
-            'gj': 'ѓ', 'e': 'е', 'zh': 'ж', 'z': 'з', 'dz': 'ѕ',
-            'i': 'и', 'j': 'ј', 'k': 'к', 'l': 'л', 'lj': 'љ',
-            'm': 'м', 'n': 'н', 'nj': 'њ', 'o': 'о', 'p': 'п',
-            'r': 'р', 's': 'с', 't': 'т', 'kj': 'ќ', 'u': 'у',
-            'f': 'ф', 'h': 'х', 'c': 'ц', 'ch': 'ч', 'dj': 'џ',
-            'sh': 'ш'
+    // Matching and transliteration happen in Postgres (see search_utils.py), the client only sends the query
+    getSearchParams(searchTerms) {
+        return {
+            q: searchTerms.join(' '),
+            match: this.adsManager.matchMethod === "some" ? "some" : "every",
+            title: this.elements.checkboxes.title.checked,
+            desc: this.elements.checkboxes.desc.checked,
         };
-        
-        let result = text.toLowerCase();
-        
-        // First replace multi-character sequences
-        Object.entries(translitmap).forEach(([lat, cyr]) => {
-            if (lat.length > 1) {
-                result = result.replace(new RegExp(lat, 'g'), cyr);
-            }
-        });
-        
-        // Then replace single characters
-        Object.entries(translitmap).forEach(([lat, cyr]) => {
-            if (lat.length === 1) {
-                result = result.replace(new RegExp(lat, 'g'), cyr);
-            }
-        });
-        
-        return result;
-    }
-
-
-    // FIXME : ALL METHODS don't work too well with current db descriptions
-    // Calculate Levenshtein distance between two strings
-    levenshteinDistance(str1, str2) {
-        const matrix = [];
-        
-        // Initialize matrix
-        for (let i = 0; i <= str2.length; i++) {
-            matrix[i] = [i];
-        }
-        for (let j = 0; j <= str1.length; j++) {
-            matrix[0][j] = j;
-        }
-        
-        // Fill matrix
-        for (let i = 1; i <= str2.length; i++) {
-            for (let j = 1; j <= str1.length; j++) {
-                if (str2.charAt(i - 1) === str1.charAt(j - 1)) {
-                    matrix[i][j] = matrix[i - 1][j - 1];
-                } else {
-                    matrix[i][j] = Math.min(
-                        matrix[i - 1][j - 1] + 1, // substitution
-                        matrix[i][j - 1] + 1,     // insertion
-                        matrix[i - 1][j] + 1      // deletion
-                    );
-                }
-            }
-        }
-        
-        return matrix[str2.length][str1.length];
-    }
-
-    // Subsequence matching - checks if all characters of term appear in text in order
-    subsequenceMatch(text, term) {
-        text = text.toLowerCase();
-        term = term.toLowerCase();
-        
-        let textIndex = 0;
-        let termIndex = 0;
-        
-        while (textIndex < text.length && termIndex < term.length) {
-            if (text[textIndex] === term[termIndex]) {
-                termIndex++;
-            }
-            textIndex++;
-        }
-        
-        return termIndex === term.length;
-    }
-    
-     // Word boundary fuzzy matching for better relevance
-    wordBoundaryFuzzy(text, term) {
-        const words = text.toLowerCase().split(/\s+/);
-        const termLower = term.toLowerCase();
-        
-        // Check if any word is similar to the search term
-        return words.some(word => {
-            // Exact match
-            if (word === termLower) return true;
-            
-            // Starts with term
-            if (word.startsWith(termLower)) return true;
-            
-            // Term starts with word (for partial matches)
-            if (termLower.startsWith(word) && word.length >= 3) return true;
-            
-            // Fuzzy match for longer words (avoid matching very short words)
-            if (word.length >= 4 && termLower.length >= 4) {
-                const distance = this.levenshteinDistance(word, termLower);
-                const maxDistance = Math.floor(Math.max(word.length, termLower.length) * 0.3); // 30% error tolerance
-                return distance <= maxDistance;
-            }
-            
-            return false;
-        });
-    }
-
-     // Smart fuzzy matching that combines multiple techniques
-    /* /smartFuzzyMatch(text, term) {
-        const textLower = text.toLowerCase();
-        const termLower = term.toLowerCase();
-        
-        // Skip fuzzy matching for very short terms to avoid false positives
-        if (termLower.length < 3) {
-            return textLower.includes(termLower);
-        }
-        
-        // 1. Exact substring match (highest priority) 
-        // FIXME ?: Strict word boundary match, if desc extraction method (backend) changes uncomment line below, else keep
-        // !!!! DON'T REMOVE COMMENT ABOVE !!!!
-        // if (textLower.includes(termLower)) {
-        //    return true;
-        //} 
-        
-        const wordBoudaryRegex = new RegExp(`\\b${termLower}\\b`);
-        if (wordBoudaryRegex.test(termLower)) {
-            return true;
-        }
-        
-        // 2. Transliteration match
-        const transliteratedText = this.transliterate(textLower);
-        const transliteratedTerm = this.transliterate(termLower);
-        if (transliteratedText.includes(transliteratedTerm) || textLower.includes(transliteratedTerm)) {
-            return true;
-        }
-        
-        // 3. Word boundary fuzzy matching
-        if (this.wordBoundaryFuzzy(text, term)) {
-            return true;
-        }
-        
-        // 4. Subsequence matching for very specific cases
-        if (termLower.length >= 5 && this.subsequenceMatch(textLower, termLower)) {
-            // Additional check: ensure enough characters match
-            const matchRatio = termLower.length / textLower.length;
-            if (matchRatio >= 0.3) { // At least 30% of the text should be the search term
-                return true;
-            }
-        }
-        
-        return false;
-    } */
-
-     matches(text, term) {
-        if (!text || !term) return false;
-        
-        const cleanText = text.toString().trim().toLowerCase();
-        const cleanTerm = term.toString().trim().toLowerCase();
-        
-        if (!cleanText || !cleanTerm) return false;
-        
-        // Skip very short terms to avoid false positives
-        if (cleanTerm.length < 2) {
-            return cleanText === cleanTerm;
-        }
-        
-        // 1. Direct substring match
-        if (cleanText.includes(cleanTerm)) {
-            return true;
-        }
-        
-        // 2. Transliteration match (Latin <-> Cyrillic)
-        const transliteratedText = this.transliterate(cleanText);
-        const transliteratedTerm = this.transliterate(cleanTerm);
-        
-        if (transliteratedText.includes(cleanTerm) || cleanText.includes(transliteratedTerm)) {
-            return true;
-        }
-        
-        // 3. Word boundary matching for partial matches
-        if (cleanTerm.length >= 3) {
-            const words = cleanText.split(/\s+/);
-            return words.some(word => {
-                // Exact word match
-                if (word === cleanTerm) return true;
-                // Word starts with term
-                if (word.startsWith(cleanTerm)) return true;
-                // Term starts with word (for partial matches like "iphone" matching "iph")
-                if (cleanTerm.startsWith(word) && word.length >= 3) return true;
-                return false;
-            });
-        }
-        
-        return false;
-    }
-
-    findTermInText(text, term, startIndex = 0) {
-        const searchText = text.substring(startIndex);
-        const cleanTerm = term.toLowerCase();
-        
-        // Direct search
-        let index = searchText.indexOf(cleanTerm);
-        if (index !== -1) {
-            return startIndex + index;
-        }
-        
-        // Transliteration search
-        const transliteratedText = this.transliterate(searchText);
-        const transliteratedTerm = this.transliterate(cleanTerm);
-        
-        index = transliteratedText.indexOf(cleanTerm);
-        if (index !== -1) {
-            return startIndex + index;
-        }
-        
-        index = searchText.indexOf(transliteratedTerm);
-        if (index !== -1) {
-            return startIndex + index;
-        }
-        
-        return -1;
     }
-
-    // Additional helper method for scoring matches (for potential future ranking)
-    getMatchScore(text, term) {
-        if (!this.matches(text, term)) return 0;
-        
-        const cleanText = text.toLowerCase();
-        const cleanTerm = term.toLowerCase();
-        
-        // Exact match gets highest score
-        if (cleanText === cleanTerm) return 100;
-        
-        // Word boundary match
-        const regex = new RegExp(`\\b${cleanTerm}\\b`);
-        if (regex.test(cleanText)) return 90;
-        
-        // Starts with term
-        if (cleanText.startsWith(cleanTerm)) return 80;
-        
-        // Contains term
-        if (cleanText.includes(cleanTerm)) return 70;
-        
-        // Transliteration match
-        const transliteratedText = this.transliterate(cleanText);
-        if (transliteratedText.includes(cleanTerm)) return 60;
-        
-        // Partial word match
-        return 50;
-    }
-
-     // Method to get ranked results (optional enhancement)
-    getRankedMatches(ads, searchTerms) {
-        if (!searchTerms || searchTerms[0] === '') return ads;
-        
-        const scoredAds = ads.map(ad => {
-            let totalScore = 0;
-            let matches = 0;
-            
-            searchTerms.forEach(term => {
-                const titleScore = this.elements.checkboxes.title.checked ? 
-                    this.getMatchScore(ad.adtitle, term) : 0;
-                const descScore = this.elements.checkboxes.desc.checked ? 
-                    this.getMatchScore(ad.addesc, term) : 0;
-                
-                const maxScore = Math.max(titleScore, descScore);
-                if (maxScore > 0) {
-                    totalScore += maxScore;
-                    matches++;
-                }
-            });
-            
-            return {
-                ad: ad,
-                score: matches > 0 ? totalScore / matches : 0,
-                matches: matches
-            };
-        });
-        
-        // Filter out non-matches and sort by score
-        return scoredAds
-            .filter(item => item.score > 0)
-            .sort((a, b) => b.score - a.score)
-            .map(item => item.ad);
-    }
-
-    matchesTermsInOrder(text, terms) {
-        if (!text || !terms || terms.length === 0) return false;
-        
-        const cleanText = text.toLowerCase();
-        let searchStartIndex = 0;
-        
-        for (const term of terms) {
-            const foundIndex = this.findTermInText(cleanText, term, searchStartIndex);
-            if (foundIndex === -1) {
-                return false;
-            }
-            searchStartIndex = foundIndex + term.length;
-        }
-        
-        return true;
-    }
-
-    // Helper that tries to find the term using smart fuzzy logic and returns its position
-    // UNUSED
-    /* _findNextMatchIndex(text, term, fromIndex) {
-        const substr = text.slice(fromIndex);
-        
-        // Use transliterated matching if needed
-        const transliteratedSubstr = this.transliterate(substr);
-        const transliteratedTerm = this.transliterate(term);
-
-        // Use your fuzzy match logic to scan from `fromIndex`
-        for (let i = 0; i < substr.length; i++) {
-            const window = substr.slice(i);
-            if (
-                this.smartFuzzyMatch(window, term) ||
-                this.smartFuzzyMatch(window, transliteratedTerm)
-            ) {
-                return fromIndex + i;
-            }
-        }
-
-        return -1;
-    } */
 }
 
 // Manages filtering and sorting
-import { normalizeCurrency } from "./utils.js";
 class FilterManager {
     constructor(adsManager) {
         this.adsManager = adsManager;
         this.elements = adsManager.elements;
-        this.searchManager = adsManager.searchManager;
         this.selectedLocation = null;
     }
-    
-    getFilteredAds(allAds, searchTerms) {
-        let filtered = this.applyBaseFilters(allAds);
-        filtered = this.applySearchTerms(filtered, searchTerms);
-        filtered = this.applyPriceFilters(filtered);
-        filtered = this.applyLocationFilter(filtered);
-        return this.sortAds(filtered);
-    }
-    
-    applyBaseFilters(ads) {
-        // Apply category filter if selected
-        if (this.adsManager.selectedCategory) {
-            return ads.filter(ad => ad.adcategory === this.adsManager.selectedCategory);
-        }
-        return ads;
-    }
-    
-    applySearchTerms(ads, searchTerms) {
-        // If no search terms, return all ads
-        if (!searchTerms || searchTerms.length === 0 || searchTerms[0] === '') {
-            return ads;
-        }
-        
-        return ads.filter(ad => {
-            // Check if we should search in title and/or description
-            const searchInTitle = this.elements.checkboxes.title.checked;
-            const searchInDesc = this.elements.checkboxes.desc.checked;
-            
-            // If neither is checked, default to searching both
-            if (!searchInTitle && !searchInDesc) {
-                return this.matchesAllTerms(ad.adtitle, searchTerms) || 
-                       this.matchesAllTerms(ad.addesc, searchTerms);
-            }
-            
-            let titleMatch = false;
-            let descMatch = false;
-            
-            if (searchInTitle) {
-                titleMatch = this.matchesAllTerms(ad.adtitle, searchTerms);
-            }
-            
-            if (searchInDesc) {
-                descMatch = this.matchesAllTerms(ad.addesc, searchTerms);
-            }
-            
-            return titleMatch || descMatch;
-        });
-    }
-
-     matchesAllTerms(text, terms) {
-        if (!text || !terms || terms.length === 0) return false;
-        
-        const ordered = this.adsManager.matchOrdered || false;  // boolean: is ordered checkbox checked?
-        const matchType = this.adsManager.matchMethod || "every"; // "every" or "some"
-
-        if (ordered) {
-            // Terms must appear in order
-            if (matchType === "every") {
-                // ALL terms must appear in order
-                return this.searchManager.matchesTermsInOrder(text, terms);
-            } else if (matchType === "some") {
-                // ANY single term must match (in order doesn't matter for single terms)
-                return terms.some(term => this.searchManager.matches(text, term));
-            }
-        } else {
-            // Terms can appear anywhere (unordered)
-            if (matchType === "every") {
-                // ALL terms must appear somewhere in the text
-                // Example: "iphone 15 17" requires text to contain "iphone" AND "15" AND "17"
-                return terms.every(term => this.searchManager.matches(text, term));
-            } else if (matchType === "some") {
-                // ANY term must appear in the text
-                // Example: "iphone 15 17" matches if text contains "iphone" OR "15" OR "17"
-                return terms.some(term => this.searchManager.matches(text, term));
-            }
-        }
-
-        // Default to "every" unordered
-        return terms.every(term => this.searchManager.matches(text, term));
-    }
-
-    
-    applyPriceFilters(ads) {
-    let filtered = [...ads];
-
-    if (this.elements.checkboxes.price1.checked) {
-        filtered = filtered.filter(ad => normalizeCurrency(ad.adprice) !== 1);
-    }
-
-    if (this.elements.checkboxes.podogovor && this.elements.checkboxes.podogovor.checked) {
-        filtered = filtered.filter(ad => normalizeCurrency(ad.adcurrency) !== "NEGOTIABLE");
-    }
-
-    // Get min and max price values
-    const minPriceInput = this.elements.priceSelector.minPrice.value;
-    const maxPriceInput = this.elements.priceSelector.maxPrice.value;
-    const minPrice = minPriceInput ? parseFloat(minPriceInput) : 1;
-    const maxPrice = maxPriceInput ? parseFloat(maxPriceInput) : Infinity;
-
-    // Get current currency from UiManager
-    const selectedCurrency = this.adsManager.uiManager.currentCurrency;
-
-    // Validate prices
-    if (isNaN(minPrice) || isNaN(maxPrice)) {
-        console.warn("Invalid price input:", { minPrice, maxPrice });
-        return filtered;
-    }
-
-    // Filter ads
-    return filtered.filter(ad => {
-        // Handle "По Договор" case
-        if (normalizeCurrency(ad.adcurrency) === "NEGOTIABLE") {
-            return minPrice === 1; // Only include negotiable prices if min price is 1
-        }
-
-        // Get the converted price for the current currency
-        const convertedPrice = ad.convertedPrices?.[selectedCurrency];
-
-        if (convertedPrice === undefined) {
-            console.warn(`Missing converted price for ad:`, ad);
-            return false; // Skip the ad if no converted price is available
-        }
-
-        // Now you can safely check if the price falls within the selected range
-        return convertedPrice >= minPrice && convertedPrice <= maxPrice;
-    });
-    }
 
     updatePricePlaceholders(currency) {
         try {
@@ -773,67 +436,6 @@ class FilterManager {
             console.error('Error updating price placeholders:', error);
         }
     }
-
-    convertPrice(price, fromCurrency, toCurrency) {
-        const CURRENCY_RATES = {
-            MKD: 1, // Base currency
-            EUR: 61.5 // 1 EUR = 61.5 MKD (adjust this rate as needed)
-        };
-
-        // Normalize currencies using the utility function
-        fromCurrency = normalizeCurrency(fromCurrency); // Use the utility function
-        toCurrency = normalizeCurrency(toCurrency); // Use the utility function
-
-        // Ensure price is a number
-        if (typeof price !== 'number') {
-            price = parseFloat(price);
-            if (isNaN(price)) {
-                console.error("Invalid price:", price);
-                return 0; // Default to 0 if price is invalid
-            }
-        }
-
-        // Convert to MKD first
-        let priceInMKD;
-        if (fromCurrency === "EUR") {
-            priceInMKD = price * CURRENCY_RATES.EUR;
-        } else {
-            priceInMKD = price; // Assume price is already in MKD
-        }
-
-        // Convert to the target currency
-        if (toCurrency === "EUR") {
-            return priceInMKD / CURRENCY_RATES.EUR;
-        } else {
-            return priceInMKD; // Return in MKD
-        }
-    }
-
-    applyLocationFilter(ads) {
-        if (!this.selectedLocation || this.selectedLocation === "") {
-            return ads;
-        }
-        return ads.filter(ad => ad.adlocation === this.selectedLocation);
-    }
-    
-    sortAds(ads) {
-        const sortedAds = [...ads];
-        switch (this.adsManager.currentSort) {
-            case 'newest':
-                sortedAds.sort((a, b) => new Date(b.addate) - new Date(a.addate));
-                break;
-            case 'oldest':
-                sortedAds.sort((a, b) => new Date(a.addate) - new Date(b.addate));
-                break;
-            case 'cheapest':
-                sortedAds.sort((a, b) => parseFloat(a.adprice) - parseFloat(b.adprice));
-                break;
-            case 'expensive':
-                sortedAds.sort((a, b) => parseFloat(b.adprice) - parseFloat(a.adprice));
-                break;
-        }
-        return sortedAds;
-    }
 }
 
 // Manages pagination
@@ -858,7 +460,7 @@ class PaginationManager {
         if (this.elements.nextBtns) {
             this.elements.nextBtns.forEach(btn => {
                 btn.addEventListener('click', () => {
-                    const maxPages = Math.ceil(this.adsManager.filteredAds.length / this.adsManager.adsPerPage);
+                    const maxPages = this.adsManager.getTotalPages();
                     if (this.adsManager.currentPage < maxPages) {
                         const shouldScrollToTop = btn.id === 'bottom-pagination-next-btn';
                         this.adsManager.handlePageChange(this.adsManager.currentPage + 1, shouldScrollToTop);
@@ -869,7 +471,7 @@ class PaginationManager {
     }
     
     updatePagination() {
-        const totalPages = Math.ceil(this.adsManager.filteredAds.length / this.adsManager.adsPerPage);
+        const totalPages = this.adsManager.getTotalPages();
         const currentPage = this.adsManager.currentPage;
         
         if (this.elements.prevBtns) {
@@ -1261,8 +863,7 @@ setupViewToggleListeners() {
                 }, 200);
             }
             
-            // Update prices and refresh results
-            this.adsManager.precomputePrices(this.currentCurrency);
+            // Price range is in the selected currency, the server converts it with its stored rates
             this.adsManager.handleSearch();
             
             // Update placeholders
@@ -1565,7 +1166,7 @@ transliterate(text) {
                             </div>
                             <div class="ad-location">Град: ${ad.adlocation}</div>
                         </div>
-                        ${this.getImageHTML(ad.adimage)}
+                        ${this.getImageHTML(ad.adimage, ad.adthumb)}
                         <div class="ad-category">${ad.adcategory}</div>
                     </div>
                 </a>
@@ -1593,12 +1194,12 @@ transliterate(text) {
 
                         <!-- MIDDLE COLUMN -->
                         <div class="ad-description">
-                            <div class="ad-description-text">${ad.addesc}</div>
+                            <div class="ad-description-text" data-ad-id="${ad.adid}"></div>
                         </div>
 
                         <!-- RIGHT COLUMN -->
                         <div class="ad-image">
-                            ${this.getImageHTML(ad.adimage)}
+                            ${this.getImageHTML(ad.adimage, ad.adthumb)}
                         </div>
                         
                         </div>
@@ -1625,15 +1226,20 @@ transliterate(text) {
         return phone;
     }
      */
-    getImageHTML(imageUrl) {
+    getImageHTML(imageUrl, thumbUrl) {
     const noImageUrl = window.location.origin + "/static/images/icons/noimage/no_image_2x.png";
     const noImage2 = "noImage2.jpg";
 
-        if (typeof imageUrl === 'string' && typeof noImage2 === 'string' && imageUrl.includes(noImage2)) {
+        if (!thumbUrl || (typeof imageUrl === 'string' && imageUrl.includes(noImage2))) {
         return `<div class="ad-image">
             <img class="ad-img" src="${noImageUrl}" loading="lazy" alt="No image available">
         </div>`;
     }
+
+    // Resized copies served by /thumb, thumbUrl has a {width} placeholder. The browser picks the width it
+    // needs for the card size and pixel density
+    const src = thumbUrl.replace('{width}', THUMBNAIL_DEFAULT_WIDTH);
+    const srcset = THUMBNAIL_WIDTHS.map(width => `${thumbUrl.replace('{width}', width)} ${width}w`).join(', ');
     
     // Create a unique ID for this image
     const imgId = 'img_' + Math.random().toString(36).substring(2, 15);
@@ -1643,38 +1249,16 @@ transliterate(text) {
         const img = document.getElementById(imgId);
         if (img) {
             img.addEventListener('error', function() {
+                this.removeAttribute('srcset');
                 this.src = noImageUrl;
             });
         }
     }, 0);
     
     return `<div class="ad-image">
-        <img id="${imgId}" class="ad-img" src="${imageUrl}" loading="lazy" alt="">
+        <img id="${imgId}" class="ad-img" src="${src}" srcset="${srcset}" sizes="${THUMBNAIL_DEFAULT_WIDTH}px" loading="lazy" alt="">
     </div>`;
     }
-
-    /* getImageHTML(imageUrl) {
-        const noImageUrl = window.location.origin + "/static/images/icons/noimage/no_image_2x.png";
-        const proxyUrl = window.location.origin + "/proxy_image?url=" + encodeURIComponent(imageUrl);
-    
-        // Create a unique ID for this image
-        const imgId = "img_" + Math.random().toString(36).substring(2, 15);
-    
-        // Setup error handler with JavaScript instead of inline `onerror`
-        setTimeout(() => {
-            const img = document.getElementById(imgId);
-            if (img) {
-                img.addEventListener("error", function () {
-                    console.warn("Image failed to load:", imageUrl);
-                    this.src = noImageUrl;
-                });
-            }
-        }, 0);
-    
-        return `<div class="ad-image">
-            <img id="${imgId}" class="ad-img" src="${proxyUrl}" loading="lazy" alt="">
-        </div>`;
-    } */ /* Maybe for future use but no use now */
 }
 
 // Initialize when DOM is ready
@@ -0,0 +1,47 @@
+from datetime import date
+
+INSERT_SQL = """
+    INSERT INTO ads.ads (title, description, link, phone, date, price, currency, location, store)
+    VALUES ('Ajfon 13', 'Kako nov', %s, '{}', %s, '100', 'МКД', 'Скопје', %s) RETURNING id
+"""
+FACET_COUNT_SQL = "SELECT coalesce(sum(count), 0) FROM ads.facet_counts"
+
+
+def make_cluster(conn, size):
+    """Ids of `size` ads, all copies of the first one. facet_counts only counts the first"""
+    with conn.cursor() as cursor:
+        ids = []
+        for i in range(size):
+            cursor.execute(INSERT_SQL, (f"https://example.mk/{i}", date(2024, 1, 1), f"store{i}"))
+            ids.append(cursor.fetchone()[0])
+        cursor.execute("UPDATE ads.ads SET cluster_id = %s WHERE id = ANY(%s)", (ids[0], ids))
+        cursor.execute("DELETE FROM ads.facet_counts")
+        cursor.execute("INSERT INTO ads.facet_counts (category, location, store, price_bucket, count) "
+                       "SELECT '', location, store, ads.price_bucket(price_value, price_mkd), 1 "
+                       "FROM ads.ads WHERE id = %s", (ids[0],))
+    conn.commit()
+    return ids
+
+
+def clusters(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT id, cluster_id FROM ads.ads ORDER BY id")
+        return cursor.fetchall()
+
+
+def test_deleted_head_promotes_next_copy(ads_table):
+    head, first, second = make_cluster(ads_table, 3)
+    with ads_table.cursor() as cursor:
+        cursor.execute("DELETE FROM ads.ads WHERE id = %s", (head,))
+    assert clusters(ads_table) == [(first, first), (second, first)]
+
+
+def test_head_leaving_cluster_promotes_next_copy(ads_table):
+    head, first, second = make_cluster(ads_table, 3)
+    with ads_table.cursor() as cursor:
+        cursor.execute("UPDATE ads.ads SET cluster_id = NULL WHERE id = %s", (head,))
+        cursor.execute(FACET_COUNT_SQL)
+        count = cursor.fetchone()[0]
+    assert clusters(ads_table) == [(head, None), (first, first), (second, first)]
+    assert count == 2  # The old head stays listed on its own, the promoted copy is added
+    ads_table.rollback()
@@ -0,0 +1,44 @@
+import pytest
+from phone_utils import normalize_phone, phone_key
+
+# The examples from phone_utils, plus invalid numbers. ads.phone_key (migrations/0011_seller_phones.sql) is a
+# hand-written twin of phone_key, both have to agree on every one
+PHONES = [
+    ('078 123 456', '38978123456'),
+    ('078/123-456', '38978123456'),
+    ('+389 78 123 456', '38978123456'),
+    ('+389 (0)78 123 456', '38978123456'),
+    ('00389 (0)78 123 456', '38978123456'),
+    ('0038978123456', '38978123456'),
+    ('38978123456', '38978123456'),
+    ('78123456', '38978123456'),
+    ('02 3123 456', '38923123456'),
+    ('+30 694 123 4567', '306941234567'),
+    ('0030 694 123 4567', '306941234567'),
+    ('  +1 (555) 010-9999 ', '15550109999'),
+    ('123', None),
+    ('078 123 45', None),
+    ('+1234567', None),
+    ('+1234567890123456', None),
+    ('По договор', None),
+    ('', None),
+]
+
+
+@pytest.mark.parametrize('phone, key', PHONES)
+def test_phone_key(phone, key):
+    assert phone_key(phone) == key
+
+
+def test_normalize_phone():
+    assert normalize_phone('00389 (0)78 123 456') == '078 123 456'
+    assert normalize_phone('0030 694 123 4567') == '+306941234567'
+    assert normalize_phone('123') is None
+
+
+def test_phone_key_matches_sql(pg):
+    with pg.cursor() as cursor:
+        for phone, _ in PHONES:
+            cursor.execute("SELECT ads.phone_key(%s)", (phone,))
+            assert cursor.fetchone()[0] == phone_key(phone), phone
+    pg.rollback()
@@ -0,0 +1,70 @@
+from datetime import date
+from search_utils import apply_search, transliterate
+
+INSERT_SQL = """
+    INSERT INTO ads.ads (title, description, link, phone, date, price, currency, location, store)
+    VALUES (%s, %s, %s, '{}', %s, '100', 'МКД', 'Скопје', 'pazar3')
+"""
+
+
+def insert_ads(conn, ads):
+    with conn.cursor() as cursor:
+        for i, (title, description) in enumerate(ads):
+            cursor.execute(INSERT_SQL, (title, description, f"https://example.mk/{i}", date(2024, 1, 1)))
+    conn.commit()
+
+# ads.translit_mk (migrations/0002_search.sql) is the SQL twin of transliterate, the index and the query have to
+# normalize the same way
+TRANSLIT_EXAMPLES = [
+    ('Ajfon 13 Pro', 'ајфон 13 про'),
+    ('Zhica na dzid', 'жица на ѕид'),
+    ('Kjebapchinja i shishe', 'ќебапчиња и шише'),
+    ('Gjevgjelija, Ljubljana, Njiva', 'ѓевѓелија, љубљана, њива'),
+    ('Djamija CH', 'џамија ч'),
+    ('Мешано mixed писмо', 'мешано миxед писмо'),
+    ('', ''),
+]
+
+
+def test_transliterate():
+    for value, expected in TRANSLIT_EXAMPLES:
+        assert transliterate(value) == expected
+
+
+def test_transliterate_matches_sql(pg):
+    with pg.cursor() as cursor:
+        for value, _ in TRANSLIT_EXAMPLES:
+            cursor.execute("SELECT ads.translit_mk(%s)", (value,))
+            assert cursor.fetchone()[0] == transliterate(value), value
+    pg.rollback()
+
+
+def test_relevance_pages_through_tied_ranks(app, ads_table):
+    from query_utils import keyset_page, list_query, SORTS
+
+    # Identical text ranks identically, more ties than fit on a page
+    insert_ads(ads_table, [('Ajfon 13 pro', 'Kako nov, so kutija')] * 7 + [('Ajfon 13', 'Polnach')] * 2)
+    seen = []
+    cursor = None
+    for _ in range(10):
+        query, rank = apply_search(list_query(), 'ajfon')
+        sorts = dict(SORTS, relevance=(rank, True))
+        rows, cursor = keyset_page(query, cursor=cursor, per_page=3, sorts=sorts, default_sort='relevance')
+        seen.extend(row.id for row in rows)
+        if cursor is None:
+            break
+
+    assert sorted(seen) == list(range(1, 10))  # Every ad exactly once
+    query, rank = apply_search(list_query(), 'ajfon')
+    ranks = {row.id: row.rank for row in query.add_columns(rank.label('rank')).all()}
+    assert seen == sorted(ranks, key=lambda ad_id: (ranks[ad_id], ad_id), reverse=True)
+
+
+def test_title_search_skips_descriptions(app, ads_table):
+    from query_utils import list_query
+
+    insert_ads(ads_table, [('Frizhider Bosch', 'Odi so televizor Samsung'), ('Televizor LG 55', 'Kako nov')])
+    query, _ = apply_search(list_query(), 'televizor', fields=('title',))
+    assert [row.id for row in query.all()] == [2]
+    query, _ = apply_search(list_query(), 'televizor')
+    assert sorted(row.id for row in query.all()) == [1, 2]
@@ -0,0 +1,284 @@
+import hashlib
+import io
+import os
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+
+# Thumbnails of the store images, served from our own origin. Every image_url is downloaded once, its bytes are
+# stored under their SHA-256, and the fixed widths are rendered from that copy on first request. Content addressed,
+# so the same photo cross-posted on two stores is stored and resized once. Files are immutable, the URLs the
+# listings hand out carry a version of the image_url and are cached by browsers for a year.
+#
+#   /thumb/<ad_id>/<width>.<format>?v=<version>    width in THUMBNAIL_WIDTHS, format in THUMBNAIL_FORMATS
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.thumbnail_cache')
+MAX_SIZE = 1024 * 1024 * 1024  # Bytes on disk, least recently used files go first
+THUMBNAIL_WIDTHS = (160, 320, 640)
+DEFAULT_WIDTH = 320  # Grid cards, the client picks another one through srcset
+THUMBNAIL_FORMATS = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+QUALITY = {'webp': 75, 'jpeg': 80}
+CACHE_MAX_AGE = 365 * 24 * 3600  # Versioned URLs never change
+UNVERSIONED_MAX_AGE = 3600  # The ad's image may be replaced by the next scrape
+FETCH_TIMEOUT = 10
+MAX_SOURCE_SIZE = 15 * 1024 * 1024
+USER_AGENT = "Mozilla/5.0"
+# image_url comes from scraped HTML, the server only downloads from the stores' image hosts (also after redirects)
+# so a listing can't make it request internal addresses
+IMAGE_HOSTS = frozenset({'media.pazar3.mk', 'reklama5.mk', 'www.reklama5.mk', 'forum.it.mk'})
+
+# Pillow does the resizing. Optional, without it the original image is served through the same cache
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+Thumbnail = namedtuple('Thumbnail', 'path mimetype etag')
+
+
+class OriginError(Exception):
+    """The image could not be downloaded (or read from the local origin)"""
+
+
+class ThumbnailError(Exception):
+    """The downloaded file is not an image Pillow can read"""
+
+
+def url_version(image_url):
+    return hashlib.sha256(image_url.encode('utf-8')).hexdigest()[:10]
+
+
+def thumbnail_url(ad_id, image_url, fmt='webp'):
+    """URL template of an ad's thumbnail, the client puts a width from THUMBNAIL_WIDTHS in place of {width}.
+    None without an image"""
+    if not image_url:
+        return None
+    return f"/thumb/{ad_id}/{{width}}.{fmt}?v={url_version(image_url)}"
+
+
+def check_image_url(url, hosts=IMAGE_HOSTS):
+    """Raise OriginError unless url is http(s) on one of the store image hosts"""
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or parts.hostname not in hosts:
+        raise OriginError(f"Unsupported image URL {url}")
+
+
+class _StoreRedirectHandler(urllib.request.HTTPRedirectHandler):
+    # Checked before a redirect is followed, the request to another host is never made
+    def __init__(self, hosts):
+        self.hosts = hosts
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_image_url(newurl, self.hosts)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+class HttpOrigin:
+    """Downloads images from the stores"""
+
+    def __init__(self, timeout=FETCH_TIMEOUT, max_size=MAX_SOURCE_SIZE, hosts=IMAGE_HOSTS):
+        self.timeout = timeout
+        self.max_size = max_size
+        self.hosts = hosts
+        self.opener = urllib.request.build_opener(_StoreRedirectHandler(hosts))
+
+    def fetch(self, url):
+        """(bytes, content type) of the image at url"""
+        check_image_url(url, self.hosts)
+        request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                check_image_url(response.geturl(), self.hosts)
+                data = response.read(self.max_size + 1)
+                content_type = response.headers.get_content_type()
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise OriginError(f"Error fetching {url}: {e}")
+        if len(data) > self.max_size:
+            raise OriginError(f"Image {url} is larger than {self.max_size} bytes")
+        return data, content_type
+
+
+class LocalOrigin:
+    """Stand-in for the stores in tests and development: https://media.pazar3.mk/a/b.jpg is read from
+    <directory>/media.pazar3.mk/a/b.jpg. Set THUMBNAIL_LOCAL_ORIGIN to use it"""
+
+    CONTENT_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.webp': 'image/webp',
+                     '.gif': 'image/gif'}
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    def fetch(self, url):
+        parts = urllib.parse.urlsplit(url)
+        path = os.path.abspath(os.path.join(self.directory, parts.netloc, parts.path.lstrip('/')))
+        if not path.startswith(self.directory + os.sep):
+            raise OriginError(f"Image URL {url} points outside the local origin")
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except OSError as e:
+            raise OriginError(f"Error reading {url} from the local origin: {e}")
+        return data, self.CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+
+
+class DiskCache:
+    """Content-addressed files with LRU eviction by mtime, spread over 256 subdirectories.
+
+    Files are only ever written whole (temp file + rename), so readers never see a partial one. Every worker
+    keeps its own estimate of the size, evict() recounts from disk.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_size=MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.size = sum(stat.st_size for _, stat in self._files())
+
+    def _files(self):
+        for subdirectory in os.scandir(self.directory):
+            if not subdirectory.is_dir():
+                continue
+            for entry in os.scandir(subdirectory.path):
+                if not entry.name.endswith('.tmp'):
+                    try:
+                        yield entry.path, entry.stat()
+                    except OSError:
+                        pass  # Evicted by another worker while listing
+
+    def path(self, name):
+        return os.path.join(self.directory, name[:2], name)
+
+    def get(self, name):
+        """Path of a cached file, None if it isn't cached. Marks it as recently used"""
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def read(self, name):
+        path = self.get(name)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def put(self, name, data):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.size += len(data)
+            if self.size > self.max_size:
+                self.evict()
+        return path
+
+    def evict(self):
+        """Delete the least recently used files until the cache is under 90% of max_size"""
+        files = sorted(self._files(), key=lambda item: item[1].st_mtime)
+        self.size = sum(stat.st_size for _, stat in files)
+        target = self.max_size * 0.9
+        for path, stat in files:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+                self.size -= stat.st_size
+            except OSError:
+                pass
+
+
+class ThumbnailService:
+    """Resized images of image URLs, through a DiskCache.
+
+    Cache files:
+        <sha256(url)>.url              content hash and content type of the source image
+        <sha256(image)>.src            the source image, as downloaded
+        <sha256(image)>-<width>.<fmt>  rendered thumbnails
+
+    Usage:
+        thumbnails = ThumbnailService(DiskCache(), HttpOrigin())
+        thumbnail = thumbnails.get(ad.image_url, 320, 'webp')
+    """
+
+    def __init__(self, cache, origin):
+        self.cache = cache
+        self.origin = origin
+
+    def source(self, image_url, cached=True):
+        """(digest, content type, bytes or None) of the image, downloaded only if it isn't cached (or cached=False)"""
+        url_name = hashlib.sha256(image_url.encode('utf-8')).hexdigest() + '.url'
+        entry = self.cache.read(url_name) if cached else None
+        if entry:
+            digest, content_type = entry.decode('ascii').split(' ', 1)
+            if self.cache.get(digest + '.src'):
+                return digest, content_type, None  # Bytes are only read if a thumbnail must be rendered
+
+        data, content_type = self.origin.fetch(image_url)
+        digest = hashlib.sha256(data).hexdigest()
+        self.cache.put(digest + '.src', data)
+        self.cache.put(url_name, f"{digest} {content_type}".encode('ascii'))
+        return digest, content_type, data
+
+    def get(self, image_url, width, fmt):
+        """Thumbnail of image_url at width (never upscaled) in fmt"""
+        digest, content_type, data = self.source(image_url)
+        if Image is None:
+            # No Pillow: the original, still from our origin and cache
+            return Thumbnail(self.cache.path(digest + '.src'), content_type, digest)
+
+        name = f"{digest}-{width}.{fmt}"
+        path = self.cache.get(name)
+        if path is None:
+            if data is None:
+                data = self.cache.read(digest + '.src')
+            if data is None:
+                # Evicted in between, or there but unreadable: downloaded once more, fetch() raises OriginError
+                # if that fails too
+                digest, content_type, data = self.source(image_url, cached=False)
+                name = f"{digest}-{width}.{fmt}"
+            path = self.cache.put(name, render(data, width, fmt))
+        return Thumbnail(path, THUMBNAIL_FORMATS[fmt], f"{digest}-{width}")
+
+
+def render(data, width, fmt):
+    """Encoded thumbnail, `width` pixels wide at most with the original aspect ratio"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEG decoder scales down by 1/2, 1/4, 1/8 while decoding, much faster than a full decode
+            image.draft('RGB', (width, image.height * width // max(image.width, 1)))
+            image = ImageOps.exif_transpose(image)  # Phone photos are often stored rotated
+            image.thumbnail((width, image.height), Image.LANCZOS)
+
+            if fmt == 'jpeg' and image.mode != 'RGB':
+                # No alpha in JPEG, transparent parts become white instead of black
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                rgba = image.convert('RGBA')
+                background.paste(rgba, mask=rgba.getchannel('A'))
+                image = background
+            elif image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+            output = io.BytesIO()
+            image.save(output, format=fmt.upper(), quality=QUALITY[fmt], optimize=fmt == 'jpeg')
+            return output.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ThumbnailError(f"Cannot make a thumbnail: {e}")
+
+
+def create_service(config):
+    # THUMBNAIL_LOCAL_ORIGIN replaces the stores with a directory of images (tests, development without network)
+    origin = LocalOrigin(config['THUMBNAIL_LOCAL_ORIGIN']) if config.get('THUMBNAIL_LOCAL_ORIGIN') else HttpOrigin()
+    cache = DiskCache(config.get('THUMBNAIL_CACHE_DIR') or CACHE_DIR,
+                      int(config.get('THUMBNAIL_CACHE_MAX_MB') or MAX_SIZE // 1024 // 1024) * 1024 * 1024)
+    return ThumbnailService(cache, origin)
@@ -11,6 +11,7 @@ class Ad:
         self.currency = currency
         self.location = location
         self.store = store
+        self.signature = None  # (MinHash, LSH buckets) from dedup.ad_signature, set by the crawl engine's workers
 
     def to_tuple(self):
         # Convert the list of phone numbers to a string (comma separated) for storage
@@ -0,0 +1,300 @@
+import asyncio
+import hashlib
+import re
+import time
+from datetime import datetime
+import asyncpg
+# Config import from Web
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../Web')))
+from config import Config
+from migration_utils import migrate_async
+from dedup import ad_signature, cluster_staged
+
+# === COLOR CONSTANTS FOR ERROR PRINTS ===
+RED = '\033[31m'
+RESET = '\033[0m'
+YELLOW = '\033[33m'
+GREEN = '\033[32m'
+
+DB_CONFIG = {
+    "user": Config.DB_USER,
+    "password": Config.DB_PASSWORD,
+    "database": Config.DB_NAME,
+    "host": Config.DB_HOST,
+    "port": int(Config.DB_PORT or 5432),
+}
+
+FLUSH_SIZE = 200  # Ads buffered before one COPY + upsert
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 4
+# Flushes running at once, one per pool connection. add() waits for a free one, so when the database falls behind
+# the writer blocks and the bounded queue pushes back on the crawlers instead of batches piling up in memory
+MAX_PENDING_FLUSHES = POOL_MAX_SIZE
+FLUSH_ATTEMPTS = 3  # The transaction rolls back on errors, a batch can simply be written again
+FLUSH_RETRY_DELAY = 2  # Seconds, doubled on every attempt
+# Worth another attempt, anything else (bad data, schema) would fail the same way again
+TRANSIENT_ERRORS = (asyncpg.PostgresConnectionError, asyncpg.InterfaceError, asyncpg.DeadlockDetectedError,
+                    asyncpg.SerializationError, OSError, asyncio.TimeoutError)
+
+AD_COLUMNS = ('title', 'description', 'link', 'image_url', 'category', 'phone', 'date', 'price', 'currency',
+              'location', 'store')
+REQUIRED_COLUMNS = ('title', 'description', 'link', 'phone', 'date', 'location', 'store')  # NOT NULL in ads.ads
+# Everything but the link (the key) goes into the content hash
+HASHED_COLUMNS = tuple(column for column in AD_COLUMNS if column != 'link')
+RECORD_COLUMNS = AD_COLUMNS + ('content_hash',)
+UPDATE_COLUMNS = HASHED_COLUMNS + ('content_hash',)
+# The MinHash signature and LSH buckets only go to the staging table, dedup.py stores them in their own tables
+STAGING_COLUMNS = RECORD_COLUMNS + ('signature', 'buckets')
+
+# Session-local staging table, rows are dropped at the end of every flush transaction
+STAGING_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS ad_staging (
+        title TEXT, description TEXT, link TEXT, image_url TEXT, category TEXT, phone TEXT[],
+        date DATE, price TEXT, currency TEXT, location TEXT, store TEXT, content_hash BYTEA,
+        signature INTEGER[], buckets BIGINT[]
+    ) ON COMMIT DELETE ROWS
+"""
+
+# New links are inserted, known links are only updated when their content hash changed. Unchanged ads are
+# not rewritten at all: no dead tuples, no index churn, no WAL. The price trigger recomputes the numeric
+# price columns of updated rows (SET price fires it)
+UPSERT_SQL = f"""
+    INSERT INTO ads.ads ({', '.join(RECORD_COLUMNS)})
+    SELECT DISTINCT ON (link) {', '.join(RECORD_COLUMNS)} FROM ad_staging ORDER BY link
+    ON CONFLICT (link) DO UPDATE SET {', '.join(f'{column} = EXCLUDED.{column}' for column in UPDATE_COLUMNS)}
+    WHERE ads.ads.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+"""
+
+# ads.facet_counts (Web/facet_utils.py) holds the number of ads per category, location, store and price bucket.
+# Inserted and deleted rows are grouped the same way and added to / subtracted from it in the same statement.
+# Rows are always touched in key order, so concurrent flushes don't deadlock on them
+FACET_ROWS_SQL = """
+    SELECT coalesce(category, '') AS category, coalesce(location, '') AS location, store,
+           ads.price_bucket(price_value, price_mkd) AS price_bucket, count(*) AS count
+    FROM {source} GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+"""
+
+# An updated ad can move to another category or price bucket: its old values (read from the statement's snapshot,
+# before the upsert) count -1, the new ones +1. xmax = 0 tells inserted rows from updated ones. Cross-posted copies
+# aren't counted (see dedup.py), the upsert never changes cluster_id so a copy stays uncounted on both sides
+UPSERT_WITH_FACETS_SQL = f"""
+    WITH previous AS (
+        SELECT link, category, location, store, price_value, price_mkd FROM ads.ads
+        WHERE link IN (SELECT link FROM ad_staging) AND (cluster_id IS NULL OR cluster_id = id)
+    ), upserted AS (
+        {UPSERT_SQL}
+        RETURNING link, category, location, store, price_value, price_mkd, xmax = 0 AS inserted,
+                  ads.ads.cluster_id IS NULL OR ads.ads.cluster_id = ads.ads.id AS listed
+    ), changes AS (
+        SELECT category, location, store, price_value, price_mkd, 1 AS delta FROM upserted WHERE listed
+        UNION ALL
+        SELECT p.category, p.location, p.store, p.price_value, p.price_mkd, -1
+        FROM previous AS p JOIN upserted AS u ON u.link = p.link AND NOT u.inserted
+    ), facets AS (
+        INSERT INTO ads.facet_counts (category, location, store, price_bucket, count)
+        SELECT coalesce(category, ''), coalesce(location, ''), store, ads.price_bucket(price_value, price_mkd),
+               sum(delta)
+        FROM changes GROUP BY 1, 2, 3, 4 HAVING sum(delta) <> 0 ORDER BY 1, 2, 3, 4
+        ON CONFLICT (category, location, store, price_bucket) DO UPDATE SET count = ads.facet_counts.count + EXCLUDED.count
+    )
+    SELECT count(*) FILTER (WHERE inserted) AS inserted, count(*) FILTER (WHERE NOT inserted) AS updated FROM upserted
+"""
+
+# The web app caches listings until this counter changes (Web/cache_utils.py)
+BUMP_GENERATION_SQL = """
+    INSERT INTO ads.scrape_generation (id, generation) VALUES (1, 1)
+    ON CONFLICT (id) DO UPDATE SET generation = ads.scrape_generation.generation + 1, updated_at = now()
+"""
+
+
+async def ensure_schema(pool):
+    """Apply pending migrations from Web/migrations, the same ones the web app runs on startup"""
+    async with pool.acquire() as conn:
+        for migration in await migrate_async(conn):
+            print(f"{GREEN}Applied migration {migration.version:04d}_{migration.name}.{RESET}")
+
+
+async def bump_generation(pool):
+    """Tell the web app that ads.ads changed, its cached pages are rebuilt on the next request"""
+    async with pool.acquire() as conn:
+        await conn.execute(BUMP_GENERATION_SQL)
+
+
+def _normalize(value):
+    # Whitespace and formatting differences between two scrapes of the same ad are not edits
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ','.join(_normalize(item) for item in value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return re.sub(r'\s+', ' ', str(value)).strip()
+
+
+def content_hash(values):
+    """16 byte digest of the normalized HASHED_COLUMNS of an ad, `values` maps column -> value"""
+    normalized = '\x1f'.join(_normalize(values[column]) for column in HASHED_COLUMNS)
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+
+def ad_to_record(ad):
+    """Convert an Ad into a tuple matching STAGING_COLUMNS, or None if a NOT NULL field is missing"""
+    date = ad.date
+    if isinstance(date, datetime):
+        date = date.date()
+
+    phone = ad.phone
+    if isinstance(phone, str):
+        phone = [phone]
+
+    price = ad.price
+    if price is not None and not isinstance(price, str):
+        price = str(price)
+
+    record = (ad.title, ad.description, ad.link, ad.image_url, ad.category, phone, date, price, ad.currency,
+              ad.location, ad.store)
+    values = dict(zip(AD_COLUMNS, record))
+    if any(values[column] is None for column in REQUIRED_COLUMNS):
+        return None
+    # Computed by the crawl engine's parse workers, only ads added by other code are hashed here
+    signature = ad.signature or ad_signature(ad.title, ad.description)
+    return record + (content_hash(values),) + tuple(signature)
+
+
+class AdSinkError(RuntimeError):
+    """Some batches could not be written, raised by close() after the report"""
+
+
+class AdSink:
+    """Buffers scraped ads and writes them in bulk through a shared asyncpg pool.
+
+    Usage:
+        async with AdSink() as sink:
+            await sink.add(ad)
+    """
+
+    def __init__(self, flush_size=FLUSH_SIZE, pool=None, max_pending=MAX_PENDING_FLUSHES):
+        self.flush_size = flush_size
+        self.pool = pool
+        self._owns_pool = pool is None
+        self._buffer = []
+        self._pending = set()
+        self._slots = asyncio.Semaphore(max_pending)
+
+        # Stats for the rows/sec report
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.clustered = 0
+        self.skipped = 0
+        self.failed = 0  # Ads of batches that could not be written
+        self.flush_time = 0.0
+        self.started = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, **DB_CONFIG)
+        await ensure_schema(self.pool)
+        self.started = time.time()
+
+    async def close(self):
+        await self.flush()
+        if self._pending:
+            await asyncio.gather(*self._pending)
+        if (self.inserted or self.updated or self.clustered) and self.pool is not None:
+            await bump_generation(self.pool)
+        if self._owns_pool and self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+        self.report()
+        if self.failed:
+            # The run must not look like a success, the caller (and the exit code) should see it
+            raise AdSinkError(f"{self.failed} ads could not be saved")
+
+    async def known_links(self, store):
+        """Links of the ads already saved for a store, used by incremental crawls"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT link FROM ads.ads WHERE store = $1", store)
+        return {row['link'] for row in rows}
+
+    async def add(self, ad):
+        self.received += 1
+        record = ad_to_record(ad)
+        if record is None:
+            self.skipped += 1
+            print(f"{YELLOW}Skipping ad {ad.link} with missing required fields.{RESET}")
+            return
+
+        self._buffer.append(record)
+        if len(self._buffer) >= self.flush_size:
+            records, self._buffer = self._buffer, []
+            # Flush in the background so producers keep going while the pool writes, but never more batches
+            # than there are connections
+            await self._slots.acquire()
+            task = asyncio.create_task(self._flush_released(records))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _flush_released(self, records):
+        try:
+            await self._write(records)
+        finally:
+            self._slots.release()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        records, self._buffer = self._buffer, []
+        async with self._slots:
+            await self._write(records)
+
+    async def _write(self, records):
+        start = time.time()
+        try:
+            for attempt in range(FLUSH_ATTEMPTS):
+                try:
+                    async with self.pool.acquire() as conn:
+                        async with conn.transaction():
+                            await conn.execute(STAGING_SQL)
+                            await conn.copy_records_to_table('ad_staging', records=records, columns=STAGING_COLUMNS)
+                            result = await conn.fetchrow(UPSERT_WITH_FACETS_SQL)
+                            # Same transaction, a listing never sees a new copy before it's marked as one
+                            clustered = await cluster_staged(conn)
+                    break
+                except TRANSIENT_ERRORS as e:
+                    if attempt + 1 == FLUSH_ATTEMPTS:
+                        raise
+                    delay = FLUSH_RETRY_DELAY * 2 ** attempt
+                    print(f"{YELLOW}Attempt {attempt + 1}: Error flushing {len(records)} ads: {e!r}, "
+                          f"retrying in {delay}s.{RESET}")
+                    await asyncio.sleep(delay)
+            self.inserted += result['inserted']
+            self.updated += result['updated']
+            self.clustered += clustered
+            print(f"{GREEN}Flushed {len(records)} ads, {result['inserted']} new, {result['updated']} changed, "
+                  f"{clustered} re-clustered.{RESET}")
+        except Exception as e:
+            self.failed += len(records)
+            print(f"{RED}Error flushing {len(records)} ads, they were not saved: {e!r}{RESET}")
+        finally:
+            self.flush_time += time.time() - start
+
+    def report(self):
+        elapsed = time.time() - self.started if self.started else 0.0
+        write_rate = (self.inserted + self.updated) / self.flush_time if self.flush_time else 0.0
+        total_rate = self.received / elapsed if elapsed else 0.0
+        unchanged = self.received - self.skipped - self.failed - self.inserted - self.updated
+        print(f"{GREEN}Ad sink: {self.received} received, {self.inserted} inserted, {self.updated} changed, "
+              f"{unchanged} unchanged, {self.skipped} skipped, {self.clustered} re-clustered as duplicates. "
+              f"DB writes {write_rate:.1f} rows/sec, overall {total_rate:.1f} ads/sec.{RESET}")
+        if self.failed:
+            print(f"{RED}Ad sink: {self.failed} ads failed to save.{RESET}")
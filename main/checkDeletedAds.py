@@ -1,16 +1,38 @@
+import argparse
 import asyncio
-import psycopg2
+import time
+from datetime import date, datetime, timedelta, timezone
 import aiohttp
-from typing import List
+import asyncpg
+from typing import Dict, List, Optional
+from ad_sink import DB_CONFIG, FACET_ROWS_SQL, bump_generation, ensure_schema
+from http_cache import HttpCache
+import http_client
+from retry_policy import RETRIES, RETRY_STATUSES, backoff_delay, breaker_for, retry_after
 
 # Configuration
-DB_HOST = "localhost"
-DB_USER = "postgres"
-DB_PASSWORD = "1234"
-DB_NAME = "ad_db"
-BATCH_SIZE = 100  # Adjust based on your server capacity
-MAX_RETRIES = 3
-TIMEOUT = 10
+BATCH_SIZE = 500  # Links read and checked together
+CONCURRENT_BATCHES = 8  # Batches checked at the same time, each holds a DB connection only while reading/writing
+TIMEOUT = 10  # Session wide, see http_client
+REQUEST_BUDGET = 20000  # Max links checked per run, the most overdue ones go first
+
+# === CHECK SCHEDULE ===
+# After every successful check the next one moves further out: base interval * 2^consecutive_ok.
+# Young ads are the ones that get sold and removed, their interval stays short
+CHECK_INTERVALS = {
+    "pazar3": timedelta(hours=12),
+    "reklama5": timedelta(hours=12),
+}
+DEFAULT_CHECK_INTERVAL = timedelta(days=1)
+FRESH_AD_AGE = timedelta(days=14)
+FRESH_MAX_BACKOFF = 2  # Fresh ads are checked at least every 2 base intervals
+MAX_CHECK_INTERVAL = timedelta(days=30)
+
+# Outcome of one check. UNKNOWN (retries ran out, store throttling or down) leaves the ad's schedule untouched,
+# it stays due and is checked again next run
+DEAD = 'dead'
+ALIVE = 'alive'
+UNKNOWN = 'unknown'
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -19,89 +41,159 @@ HEADERS = {
     "Accept-Language": "mk-MK,mk;q=0.9"
 }
 
-
-async def check_link(session: aiohttp.ClientSession, url: str) -> bool:
-    """Check if URL returns 404 (with retries)"""
-    for _ in range(MAX_RETRIES):
+# Keyset pagination over the due ads, every batch starts after the last (next_check_at, id) of the previous one.
+# Checked ads move into the future, so they are never read twice and deletes don't shift later batches
+SELECT_BATCH_SQL = """
+    SELECT id, link, store, date, consecutive_ok, next_check_at FROM ads.ads
+    WHERE (next_check_at, id) > ($1, $2) AND next_check_at <= now()
+    ORDER BY next_check_at, id LIMIT $3
+"""
+DELETE_SQL = "DELETE FROM ads.ads WHERE link = ANY($1::text[])"
+# Deleted ads are subtracted from ads.facet_counts in the same statement, see ad_sink. Cross-posted copies were
+# never counted, a deleted first posting's promoted copy is added by the ads_promote_cluster_head trigger
+DELETE_WITH_FACETS_SQL = f"""
+    WITH deleted AS (
+        {DELETE_SQL}
+        RETURNING category, location, store, price_value, price_mkd, cluster_id IS NULL OR cluster_id = id AS listed
+    ), facets AS (
+        UPDATE ads.facet_counts AS f SET count = f.count - d.count
+        FROM ({FACET_ROWS_SQL.format(source='deleted WHERE listed')}) AS d
+        WHERE (f.category, f.location, f.store, f.price_bucket) = (d.category, d.location, d.store, d.price_bucket)
+    )
+    SELECT count(*) FROM deleted
+"""
+RESCHEDULE_SQL = """
+    UPDATE ads.ads AS a SET last_checked_at = now(), consecutive_ok = a.consecutive_ok + 1, next_check_at = u.next_check_at
+    FROM unnest($1::text[], $2::timestamptz[]) AS u(link, next_check_at)
+    WHERE a.link = u.link
+"""
+
+
+def next_check_delay(store, ad_date, consecutive_ok, today=None):
+    """Time until the next check of an ad that was just found alive for the consecutive_ok-th time in a row"""
+    base = CHECK_INTERVALS.get(store, DEFAULT_CHECK_INTERVAL)
+    backoff = 2 ** min(consecutive_ok, 16)
+    if ad_date and (today or date.today()) - ad_date < FRESH_AD_AGE:
+        backoff = min(backoff, FRESH_MAX_BACKOFF)
+    return min(base * backoff, MAX_CHECK_INTERVAL)
+
+
+async def check_link(session: aiohttp.ClientSession, url: str, cache: Optional[HttpCache] = None) -> str:
+    """DEAD if the URL returns 404, ALIVE for any other answer, UNKNOWN if retries ran out"""
+    # Pages the scrapers cached are checked conditionally, 304 means the ad is still there
+    entry = await cache.get_async(url) if cache else None
+    headers = HttpCache.conditional_headers(entry)
+    breaker = breaker_for(url)
+    for attempt in range(RETRIES):
+        wait = None
+        await breaker.wait()
         try:
-            async with session.head(
-                    url,
-                    headers=HEADERS,
-                    timeout=aiohttp.ClientTimeout(total=TIMEOUT),
-                    allow_redirects=True
-            ) as response:
-                if response.status == 404:
-                    return True
-                return False
+            async with session.head(url, headers=headers, allow_redirects=True) as response:
+                if response.status in RETRY_STATUSES:
+                    # Throttled or failing store, back off instead of reading it as alive
+                    breaker.record(False)
+                    wait = retry_after(response.headers)
+                    if wait is not None:
+                        breaker.pause(wait)
+                else:
+                    breaker.record(True)
+                    if response.status == 404:
+                        if entry:
+                            await cache.delete_async(url)
+                        return DEAD
+                    if response.status == 304 and entry:
+                        await cache.touch_async(url)
+                    return ALIVE
         except (aiohttp.ClientError, asyncio.TimeoutError):
-            continue
-    return False  # Assume not 404 if retries fail
+            breaker.record(False)
+        if attempt < RETRIES - 1:
+            await asyncio.sleep(wait if wait is not None else backoff_delay(attempt))
+    return UNKNOWN  # Not an answer, neither dead nor alive
 
 
-async def process_batch(session: aiohttp.ClientSession, links: List[str]) -> List[str]:
-    tasks = [check_link(session, link) for link in links]
+async def process_batch(session: aiohttp.ClientSession, links: List[str],
+                        cache: Optional[HttpCache] = None) -> Dict[str, str]:
+    """link -> DEAD / ALIVE / UNKNOWN"""
+    # The connector's per host limit bounds the requests in flight, the rest wait for a pooled connection
+    tasks = [check_link(session, link, cache) for link in links]
     results = await asyncio.gather(*tasks)
-    return [link for link, is_404 in zip(links, results) if is_404]
-
-
-async def main():
-    """Main cleanup routine"""
-    loop = asyncio.get_running_loop()
-
-    # Database connection
-    conn = await loop.run_in_executor(
-        None,
-        lambda: psycopg2.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            dbname=DB_NAME
-        )
-    )
-
-    offset = 0
-    total_deleted = 0
-
-    async with aiohttp.ClientSession() as session:
-        while True:
-            # Fetch batch
-            def fetch_batch():
-                cur = conn.cursor()
-                cur.execute(
-                    "SELECT link FROM ads.ads ORDER BY id LIMIT %s OFFSET %s",
-                    (BATCH_SIZE, offset)
-                )
-                return [row[0] for row in cur.fetchall()]
-
-            links = await loop.run_in_executor(None, fetch_batch)
-            if not links:
+    return dict(zip(links, results))
+
+
+async def read_batches(pool: asyncpg.Pool, queue: asyncio.Queue, workers: int, budget: int):
+    """Walk the due ads, most overdue first, and hand the batches to the workers. One None per worker marks the end"""
+    # asyncpg sends datetime.min as -infinity (and reads -infinity back as datetime.min), so never checked ads are included
+    last_check, last_id = datetime.min.replace(tzinfo=timezone.utc), 0
+    try:
+        while budget > 0:
+            async with pool.acquire() as conn:
+                rows = await conn.fetch(SELECT_BATCH_SQL, last_check, last_id, min(BATCH_SIZE, budget))
+            if not rows:
                 break
-
-            # Check links
-            invalid_links = await process_batch(session, links)
-
-            # Delete invalid links
-            if invalid_links:
-                def delete_links():
-                    cur = conn.cursor()
-                    placeholders = ','.join(['%s'] * len(invalid_links))
-                    cur.execute(
-                        f"DELETE FROM ads.ads WHERE link IN ({placeholders})",
-                        invalid_links
-                    )
-                    conn.commit()
-                    return cur.rowcount
-
-                deleted_count = await loop.run_in_executor(None, delete_links)
-                total_deleted += deleted_count
-                print(f"Deleted {deleted_count} invalid links (Total: {total_deleted})")
-
-            offset += BATCH_SIZE
-
-    # Cleanup
-    await loop.run_in_executor(None, conn.close)
-    print(f"Cleanup complete. Total deleted: {total_deleted}")
+            last_check, last_id = rows[-1]['next_check_at'], rows[-1]['id']
+            budget -= len(rows)
+            # Blocks while every worker is busy, at most CONCURRENT_BATCHES batches wait in memory
+            await queue.put(rows)
+    finally:
+        for _ in range(workers):
+            await queue.put(None)
+
+
+async def sweep_batches(pool: asyncpg.Pool, session: aiohttp.ClientSession, queue: asyncio.Queue,
+                        cache: HttpCache, stats: dict):
+    while True:
+        rows = await queue.get()
+        if rows is None:
+            break
+
+        states = await process_batch(session, [row['link'] for row in rows], cache)
+        stats['checked'] += len(rows)
+
+        invalid_links = [link for link, state in states.items() if state == DEAD]
+        # Unknown ads are neither deleted nor rescheduled, a throttled store must not push its ads out by weeks
+        alive = [row for row in rows if states[row['link']] == ALIVE]
+        stats['unknown'] += len(rows) - len(alive) - len(invalid_links)
+        now = datetime.now(timezone.utc)
+        next_checks = [now + next_check_delay(row['store'], row['date'], row['consecutive_ok'] + 1) for row in alive]
+
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                if alive:
+                    await conn.execute(RESCHEDULE_SQL, [row['link'] for row in alive], next_checks)
+                if invalid_links:
+                    deleted_count = await conn.fetchval(DELETE_WITH_FACETS_SQL, invalid_links)
+        if invalid_links:
+            stats['deleted'] += deleted_count
+            print(f"Deleted {deleted_count} invalid links (Total: {stats['deleted']})")
+
+
+async def main(budget: int = REQUEST_BUDGET):
+    """Main cleanup routine, checks at most `budget` of the ads that are due"""
+    start_time = time.time()
+    stats = {'checked': 0, 'deleted': 0, 'unknown': 0}
+    cache = HttpCache()
+    queue = asyncio.Queue(maxsize=CONCURRENT_BATCHES)
+
+    # One connection for the reader and one per worker, no more are ever needed
+    async with asyncpg.create_pool(min_size=1, max_size=CONCURRENT_BATCHES + 1, **DB_CONFIG) as pool:
+        await ensure_schema(pool)  # Liveness columns are added by migrations/0006_liveness.sql
+        async with http_client.create_session(headers=HEADERS, timeout=TIMEOUT) as session:
+            await asyncio.gather(
+                read_batches(pool, queue, CONCURRENT_BATCHES, budget),
+                *(sweep_batches(pool, session, queue, cache, stats) for _ in range(CONCURRENT_BATCHES)),
+            )
+        if stats['deleted']:
+            await bump_generation(pool)
+
+    elapsed = time.time() - start_time
+    http_client.stats.report()
+    print(f"Cleanup complete. Checked {stats['checked']} links in {elapsed:.1f}s "
+          f"({stats['checked'] / elapsed if elapsed else 0:.1f} links/sec). Total deleted: {stats['deleted']}, "
+          f"no answer (still due): {stats['unknown']}")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Check due ads and delete the ones that are gone")
+    parser.add_argument("--budget", type=int, default=REQUEST_BUDGET, help="Max links checked in this run")
+    args = parser.parse_args()
+    asyncio.run(main(args.budget))
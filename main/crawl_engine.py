@@ -0,0 +1,262 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import aiohttp
+from ad_sink import AdSink
+from dedup import ad_signature
+from html_utils import parse_html
+import http_client
+from rate_limit import limiter_for
+from retry_policy import RETRIES, RETRY_STATUSES, BASE_DELAY, backoff_delay, breaker_for, retry_after
+
+# === COLOR CONSTANTS FOR ERROR PRINTS ===
+RED = '\033[31m'
+RESET = '\033[0m'
+YELLOW = '\033[33m'
+GREEN = '\033[32m'
+
+# === CONFIGURATION ===
+QUEUE_SIZE = 100  # Max scraped ads waiting for the writer, fetching pauses when it is full
+PARSE_WORKERS = os.cpu_count() or 1  # Processes parsing pages, 0 parses on the event loop
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Referer": "https://www.google.com/",
+    "DNT": "1",
+    "Upgrade-Insecure-Requests": "1",
+}
+
+
+class StoreAdapter:
+    """Everything that is specific to one store. The engine does the fetching, concurrency and saving.
+
+    parse_listing(html, page_num) -> list of partially filled Ad objects
+    parse_detail(html, ad) -> the same Ad filled from its detail page, or None to skip it
+    prepare(ad) -> final conversion before saving, None drops the ad
+
+    Adapters whose prepare() drops every ad (test scrapers) set persists = False, a run with only such adapters
+    has no sink and never connects to the database.
+    """
+    store = None
+    start_page = 1
+    end_page = 1
+    batch_size = 1  # Listing pages fetched together
+    fetch_details = True
+    persists = True
+    headers = DEFAULT_HEADERS
+    timeout = None  # Seconds, None uses the session's timeout
+
+    def parse_html(self, html):
+        return parse_html(html)
+
+    def listing_url(self, page):
+        raise NotImplementedError
+
+    def parse_listing(self, html, page_num):
+        raise NotImplementedError
+
+    def parse_detail(self, html, ad):
+        return ad
+
+    def prepare(self, ad):
+        return ad
+
+
+async def fetch_page(session, url, headers=DEFAULT_HEADERS, timeout=None, retries=RETRIES, delay=BASE_DELAY, cache=None):
+    # With a cache the request is conditional, an unchanged page comes back as an empty 304
+    entry = await cache.get_async(url) if cache else None
+    if entry:
+        headers = {**headers, **cache.conditional_headers(entry)}
+    options = {'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+    breaker = breaker_for(url)
+
+    for attempt in range(retries):
+        wait = None
+        # Waits while the store's circuit breaker is open
+        await breaker.wait()
+        try:
+            # Per-store concurrency and request rate, the slot is released before the retry sleep
+            async with limiter_for(url).slot():
+                async with session.get(url, headers=headers, **options) as response:
+                    if response.status == 304 and entry:
+                        breaker.record(True)
+                        await cache.touch_async(url)
+                        return entry['body']
+                    if response.status == 200:
+                        body = await response.text()
+                        breaker.record(True)
+                        if cache:
+                            await cache.store_async(url, body, response.headers)
+                        return body
+                    if response.status not in RETRY_STATUSES:
+                        # The store answered fine, the page just isn't there
+                        breaker.record(True)
+                        print(f"{RED}Failed to fetch {url} (status {response.status}), not retrying.{RESET}")
+                        return None
+                    breaker.record(False)
+                    wait = retry_after(response.headers)
+                    if wait is not None:
+                        breaker.pause(wait)  # Every request to the store waits, not just this one
+                    print(f"{RED}Attempt {attempt + 1}: Failed to fetch {url} (status {response.status}){RESET}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            breaker.record(False)
+            print(f"{RED}Attempt {attempt + 1}: Error fetching {url} - {e!r}{RESET}")
+        except Exception as e:
+            # Not a network problem (undecodable body, cache write failing), retrying won't help. Only this page
+            # is lost, the gathers in crawl_store must not see the exception or the whole run stops
+            print(f"{RED}Error handling {url} - {e!r}, skipping it.{RESET}")
+            return None
+        if attempt < retries - 1:
+            await asyncio.sleep(wait if wait is not None else backoff_delay(attempt, delay))
+    print(f"{RED}Giving up on {url} after {retries} attempts.{RESET}")
+    return None
+
+
+class CrawlEngine:
+    """Runs one or more store adapters concurrently and streams their ads to a single writer.
+
+    Usage:
+        await CrawlEngine([Pazar3Adapter(), Reklama5Adapter()], parse_workers=4).run()
+
+    With a cache (http_cache.HttpCache) pages are fetched with conditional requests and unchanged ones are
+    read from disk. With incremental=True ads already in ads.ads are not fetched again, and a store stops paging
+    at the first listing page that has only known ads. Listings are newest first.
+    """
+
+    def __init__(self, adapters, sink=None, queue_size=QUEUE_SIZE, parse_workers=PARSE_WORKERS, incremental=False,
+                 cache=None):
+        self.adapters = adapters
+        self.sink = sink
+        self.cache = cache
+        self.incremental = incremental
+        self.queue_size = queue_size
+        self.parse_workers = parse_workers
+        self.executor = None
+        self.scraped = {}
+
+    async def run(self):
+        start_time = time.time()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        if self.sink is None and any(adapter.persists for adapter in self.adapters):
+            self.sink = AdSink()
+        sink = self.sink
+
+        writer = None
+        if sink:
+            await sink.open()
+            writer = asyncio.create_task(self._write(queue, sink))
+        if self.parse_workers:
+            self.executor = ProcessPoolExecutor(max_workers=self.parse_workers)
+        try:
+            async with http_client.create_session() as session:
+                await asyncio.gather(*(self.crawl_store(session, adapter, queue) for adapter in self.adapters))
+        finally:
+            try:
+                if writer:
+                    await queue.put(None)
+                    await writer
+                    await sink.close()  # Raises AdSinkError when batches could not be saved
+            finally:
+                if self.executor:
+                    self.executor.shutdown()
+                    self.executor = None
+
+        for store, count in self.scraped.items():
+            print(f"{GREEN}{store}: scraped {count} ads.{RESET}")
+        http_client.stats.report()
+        if self.cache:
+            self.cache.report()
+        print(f"Total time: {time.time() - start_time:.2f} seconds")
+        return self.scraped
+
+    async def crawl_store(self, session, adapter, queue):
+        self.scraped[adapter.store] = 0
+        known = set()
+        if self.incremental and adapter.persists:
+            known = await self.sink.known_links(adapter.store)
+            print(f"{adapter.store}: {len(known)} known ads, skipping them")
+
+        for batch_start in range(adapter.start_page, adapter.end_page + 1, adapter.batch_size):
+            batch_end = min(batch_start + adapter.batch_size - 1, adapter.end_page)
+            pages = range(batch_start, batch_end + 1)
+            print(f"{adapter.store}: scraping pages {batch_start} to {batch_end}")
+
+            pages_responses = await asyncio.gather(*(self.fetch(session, adapter, adapter.listing_url(page))
+                                                     for page in pages))
+
+            ad_tasks = []
+            caught_up = False
+            for page_num, page_content in zip(pages, pages_responses):
+                if not page_content:
+                    continue
+                try:
+                    ads = await self.parse(adapter.parse_listing, page_content, page_num)
+                except Exception as e:
+                    print(f"{RED}{adapter.store}: error parsing page {page_num}: {e}{RESET}")
+                    continue
+                if not ads:
+                    print(f"{RED}{adapter.store}: no ads found on page {page_num}.{RESET}")
+                    continue
+                if known:
+                    new_ads = [ad for ad in ads if ad.link not in known]
+                    if not new_ads:
+                        caught_up = True
+                    ads = new_ads
+                ad_tasks.extend(self.process_ad(session, adapter, ad, page_num, queue) for ad in ads)
+
+            # Detail pages for the whole batch are fetched concurrently, limited per store by rate_limit
+            results = await asyncio.gather(*ad_tasks)
+            self.scraped[adapter.store] += sum(results)
+
+            print(f"{adapter.store}: finished scraping pages {batch_start} to {batch_end}")
+            if caught_up:
+                print(f"{GREEN}{adapter.store}: reached already known ads, stopping.{RESET}")
+                break
+
+    async def process_ad(self, session, adapter, ad, page_num, queue):
+        try:
+            if adapter.fetch_details:
+                detail_content = await self.fetch(session, adapter, ad.link)
+                if not detail_content:
+                    return False
+                ad = await self.parse(adapter.parse_detail, detail_content, ad)
+                if ad is None:
+                    return False
+
+            ad = adapter.prepare(ad)
+            if ad is None or not adapter.persists:
+                return False
+            # The MinHash for duplicate detection is CPU work like parsing, done in a worker and not by the writer
+            ad.signature = await self.parse(ad_signature, ad.title, ad.description)
+
+            # Handed to the writer task right away, blocks while the queue is full
+            await queue.put(ad)
+            return True
+        except Exception as e:
+            print(f"{RED}{adapter.store}: error processing ad on page {page_num}: {e}{RESET}")
+            return False
+
+    async def parse(self, func, *args):
+        # Parsing is CPU bound, in the worker processes it doesn't block fetching on the event loop.
+        # func is a bound adapter method, the adapter, the html and the Ad objects are pickled to and from the worker
+        if self.executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def fetch(self, session, adapter, url):
+        return await fetch_page(session, url, headers=adapter.headers, timeout=adapter.timeout, cache=self.cache)
+
+    async def _write(self, queue, sink):
+        # Single writer, every ad is taken off the queue and written exactly once. None marks the end of the run
+        while True:
+            ad = await queue.get()
+            try:
+                if ad is None:
+                    break
+                await sink.add(ad)
+            except Exception as e:
+                print(f"{RED}Error saving ad {ad.link}: {e}{RESET}")
+            finally:
+                queue.task_done()
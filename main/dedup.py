@@ -0,0 +1,192 @@
+import hashlib
+import random
+import re
+import struct
+from html_utils import clean_description
+
+# Near-duplicate detection for ads cross-posted on several stores. Every ad gets a MinHash signature of the word
+# shingles of its title and cleaned description. The signature is cut into BANDS bands of ROWS values. Each band
+# is hashed into a bucket, and ads that share a bucket in any band are candidates. Finding candidates is an index
+# lookup on ads.ad_lsh_buckets (Web/migrations/0010_dedup.sql), so the cost does not depend on the table size.
+# Candidates are confirmed with the signature estimate, then the ad joins the candidate's cluster.
+#
+# ads.ads.cluster_id is NULL for ads without duplicates. Otherwise every member of a cluster holds the id of its
+# first ad (the smallest id), and the listings only show rows WHERE cluster_id IS NULL OR cluster_id = id.
+# A first posting that is deleted, or edited so it leaves its cluster, is replaced by the next oldest copy
+# (ads.promote_cluster_head, Web/migrations/0012 and 0014).
+SHINGLE_SIZE = 3  # Words per shingle
+MAX_WORDS = 300  # Long descriptions are cut, the start is enough to recognize a copy
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Two ads with Jaccard similarity s share at least one bucket with probability 1 - (1 - s^4)^16:
+# 99.9% at 0.8, 64% at 0.5, 12% at 0.3
+SIMILARITY_THRESHOLD = 0.8  # Estimated Jaccard similarity of the shingles
+TITLE_THRESHOLD = 0.5  # Jaccard similarity of the title words, dealers reuse one long description for every ad
+
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 32) - 1
+# Fixed seed: signatures are stored, they must stay comparable between runs
+_rng = random.Random(20240601)
+PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+WORD = re.compile(r'\w+')
+
+
+def words(text):
+    return WORD.findall(text.lower()) if text else []
+
+
+def shingles(title, description):
+    """Set of SHINGLE_SIZE word shingles of the title and the cleaned description"""
+    tokens = words(title) + words(clean_description(description or ''))[:MAX_WORDS]
+    if len(tokens) < SHINGLE_SIZE:
+        return {' '.join(tokens)}
+    return {' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+
+def _shingle_hash(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little') % _PRIME
+
+
+def _signed32(value):
+    # Stored as INTEGER[], Postgres has no unsigned type
+    return value - (1 << 32) if value >= (1 << 31) else value
+
+
+def minhash(shingle_set):
+    """NUM_PERM minimum hashes, one per (a * x + b) mod p permutation"""
+    hashes = [_shingle_hash(shingle) for shingle in shingle_set]
+    return [_signed32(min((a * x + b) % _PRIME for x in hashes) & _MASK) for a, b in PERMUTATIONS]
+
+
+def lsh_buckets(signature):
+    """One BIGINT bucket per band, the index of a bucket in the list is its band"""
+    buckets = []
+    for band in range(BANDS):
+        rows = struct.pack(f'<{ROWS}i', *signature[band * ROWS:(band + 1) * ROWS])
+        digest = hashlib.blake2b(rows, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'little', signed=True))
+    return buckets
+
+
+def ad_signature(title, description):
+    """(signature, buckets) of an ad, the two extra columns of the sink's staging table"""
+    signature = minhash(shingles(title, description))
+    return signature, lsh_buckets(signature)
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity, the share of equal minimum hashes"""
+    return sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+
+
+def title_similarity(title, other):
+    a, b = set(words(title)), set(words(other))
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def assign_clusters(ads, candidates):
+    """Cluster ids for a batch of new or changed ads.
+
+    ads: {ad_id: (title, signature)}
+    candidates: {ad_id: [(other_id, other_title, other_signature, other_cluster_id), ...]} from the LSH buckets
+    Returns {ad_id: cluster_id or None} for the ads and for the candidates that start a cluster with them.
+    Ads are handled in id order, so a copy always joins the cluster of the first posting. An ad matching two
+    clusters joins the older one, the clusters are not merged.
+    """
+    clusters = {}
+    for ad_id in sorted(ads):
+        title, signature = ads[ad_id]
+        matches = [(other_id, clusters.get(other_id, other_cluster))
+                   for other_id, other_title, other_signature, other_cluster in candidates.get(ad_id, ())
+                   if similarity(signature, other_signature) >= SIMILARITY_THRESHOLD
+                   and title_similarity(title, other_title) >= TITLE_THRESHOLD]
+        if not matches:
+            clusters.setdefault(ad_id, None)
+            continue
+
+        cluster_id = min([cluster or other_id for other_id, cluster in matches] + [clusters.get(ad_id) or ad_id])
+        clusters[ad_id] = cluster_id
+        for other_id, cluster in matches:
+            if cluster is None:
+                clusters[other_id] = cluster_id
+    return clusters
+
+
+# Signatures are only rewritten when they changed, the returned ads are the ones to (re)cluster
+STORE_SIGNATURES_SQL = """
+    WITH staged AS (
+        SELECT DISTINCT ON (s.link) a.id AS ad_id, s.title, s.signature
+        FROM ad_staging AS s JOIN ads.ads AS a ON a.link = s.link
+        ORDER BY s.link
+    ), stored AS (
+        INSERT INTO ads.ad_signatures (ad_id, signature)
+        SELECT ad_id, signature FROM staged ORDER BY ad_id
+        ON CONFLICT (ad_id) DO UPDATE SET signature = EXCLUDED.signature
+        WHERE ads.ad_signatures.signature IS DISTINCT FROM EXCLUDED.signature
+        RETURNING ad_id, signature
+    )
+    SELECT stored.ad_id, staged.title, stored.signature FROM stored JOIN staged USING (ad_id)
+"""
+# Separate statements: a DELETE and an INSERT of the same keys in one statement may run in either order
+DELETE_BUCKETS_SQL = "DELETE FROM ads.ad_lsh_buckets WHERE ad_id = ANY($1::int[])"
+INSERT_BUCKETS_SQL = """
+    INSERT INTO ads.ad_lsh_buckets (band, bucket, ad_id)
+    SELECT DISTINCT b.band - 1, b.bucket, a.id
+    FROM ad_staging AS s JOIN ads.ads AS a ON a.link = s.link
+    CROSS JOIN LATERAL unnest(s.buckets) WITH ORDINALITY AS b(bucket, band)
+    WHERE a.id = ANY($1::int[])
+"""
+# Served from the (band, bucket, ad_id) primary key
+CANDIDATES_SQL = """
+    SELECT DISTINCT mine.ad_id, other.ad_id AS other_id, a.title, s.signature, a.cluster_id
+    FROM ads.ad_lsh_buckets AS mine
+    JOIN ads.ad_lsh_buckets AS other ON other.band = mine.band AND other.bucket = mine.bucket
+                                      AND other.ad_id <> mine.ad_id
+    JOIN ads.ad_signatures AS s ON s.ad_id = other.ad_id
+    JOIN ads.ads AS a ON a.id = other.ad_id
+    WHERE mine.ad_id = ANY($1::int[])
+"""
+# ads.facet_counts only counts listed ads (Web/facet_utils.py). An ad that becomes a copy counts -1, a copy that
+# becomes listed again +1, in the same statement. Old cluster ids are read from the statement's snapshot
+SET_CLUSTERS_SQL = """
+    WITH previous AS (
+        SELECT id, cluster_id IS NULL OR cluster_id = id AS listed FROM ads.ads WHERE id = ANY($1::int[])
+    ), updated AS (
+        UPDATE ads.ads AS a SET cluster_id = c.cluster_id
+        FROM unnest($1::int[], $2::int[]) AS c(id, cluster_id)
+        WHERE a.id = c.id AND a.cluster_id IS DISTINCT FROM c.cluster_id
+        RETURNING a.id, a.category, a.location, a.store, a.price_value, a.price_mkd,
+                  a.cluster_id IS NULL OR a.cluster_id = a.id AS listed
+    ), facets AS (
+        INSERT INTO ads.facet_counts (category, location, store, price_bucket, count)
+        SELECT coalesce(u.category, ''), coalesce(u.location, ''), u.store, ads.price_bucket(u.price_value, u.price_mkd),
+               sum(CASE WHEN u.listed THEN 1 ELSE -1 END)
+        FROM updated AS u JOIN previous AS p USING (id)
+        WHERE u.listed <> p.listed
+        GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+        ON CONFLICT (category, location, store, price_bucket) DO UPDATE SET count = ads.facet_counts.count + EXCLUDED.count
+    )
+    SELECT count(*) FROM updated
+"""
+
+
+async def cluster_staged(conn):
+    """Store signatures and buckets of the staged ads and update their clusters. Runs in the sink's flush
+    transaction, after the upsert. Returns the number of ads whose cluster_id changed"""
+    rows = await conn.fetch(STORE_SIGNATURES_SQL)
+    if not rows:
+        return 0
+    ids = [row['ad_id'] for row in rows]
+    await conn.execute(DELETE_BUCKETS_SQL, ids)
+    await conn.execute(INSERT_BUCKETS_SQL, ids)
+
+    candidates = {}
+    for row in await conn.fetch(CANDIDATES_SQL, ids):
+        candidates.setdefault(row['ad_id'], []).append((row['other_id'], row['title'], row['signature'],
+                                                        row['cluster_id']))
+    clusters = assign_clusters({row['ad_id']: (row['title'], row['signature']) for row in rows}, candidates)
+
+    ad_ids = sorted(clusters)  # Rows locked in id order, concurrent flushes don't deadlock
+    return await conn.fetchval(SET_CLUSTERS_SQL, ad_ids, [clusters[ad_id] for ad_id in ad_ids])
@@ -0,0 +1,37 @@
+import re
+import lxml.html
+
+# Store parsers work on lxml trees with XPath. Parsing and searching happen in C (libxml2),
+# BeautifulSoup spent most of its time building Python objects for every tag on the page
+
+
+def parse_html(html):
+    return lxml.html.fromstring(html)
+
+
+def has_class(name):
+    """XPath predicate matching one class in a multi-class attribute, like BeautifulSoup's class_="name" """
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def first(node, path):
+    result = node.xpath(path)
+    return result[0] if result else None
+
+
+def text(node):
+    return node.text_content().strip() if node is not None else None
+
+
+def stripped_text(node):
+    # Same as BeautifulSoup's get_text(strip=True), every text piece is stripped and joined without separator
+    return "".join(piece.strip() for piece in node.itertext())
+
+
+def clean_description(description):
+    # Seller footers (contact details, other listings) follow a run of blank lines, only the text before it is kept.
+    # Used by the pazar3 parser and by the duplicate detection (dedup.py) for every store
+    cleaned_text = re.sub(r'\n\s*\n\s*\n+', '\n\n===CUT===\n\n', description)
+    if '===CUT===' in cleaned_text:
+        cleaned_text = cleaned_text.split('===CUT===')[0]
+    return cleaned_text.strip()
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+# === CONFIGURATION ===
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.http_cache')
+TTL = 7 * 24 * 3600  # Entries not used for this long are dropped, the next fetch downloads the page again
+MAX_SIZE = 512 * 1024 * 1024  # Bytes on disk, least recently used entries go first
+
+
+class HttpCache:
+    """On-disk cache of fetched pages, revalidated with ETag / Last-Modified.
+
+    One JSON file per URL holding the body and validators. A cached page is only served after the server
+    answers the conditional request with 304 Not Modified, so it is never stale.
+
+    Usage:
+        entry = await cache.get_async(url)
+        headers.update(cache.conditional_headers(entry))
+        ... 304 -> await cache.touch_async(url), entry['body']   200 -> await cache.store_async(url, body, headers)
+
+    The *_async methods run the file I/O, JSON and eviction scans in a worker thread, so the crawlers' event loop
+    isn't blocked by the disk. The plain methods are the same calls without the thread.
+    """
+
+    def __init__(self, directory=CACHE_DIR, ttl=TTL, max_size=MAX_SIZE):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()  # size is updated from the worker threads
+        self.size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith('.json'))
+
+        # Stats for the report
+        self.hits = 0  # 304, served from disk
+        self.misses = 0
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, url):
+        path = self._path(url)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        # A 304 touches the file, so the TTL counts from the last time the page was known to be current
+        if time.time() - os.path.getmtime(path) > self.ttl:
+            self.delete(url)
+            return None
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, body, headers):
+        self.misses += 1
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return  # Nothing to revalidate with, the page would be downloaded again anyway
+
+        path = self._path(url)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        data = json.dumps({'url': url, 'etag': etag, 'last_modified': last_modified,
+                           'stored_at': time.time(), 'body': body}, ensure_ascii=False)
+        # Written to a temp file first, a crash never leaves a half written entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # store() runs in threads too
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.size += os.path.getsize(path) - old_size
+            if self.size > self.max_size:
+                self.evict()
+
+    def touch(self, url):
+        # Access time for LRU eviction is the file's mtime
+        self.hits += 1
+        try:
+            os.utime(self._path(url))
+        except OSError:
+            pass
+
+    def delete(self, url):
+        path = self._path(url)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            with self.lock:
+                self.size -= size
+        except OSError:
+            pass
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones until the cache is under 90% of max_size.
+        Called with the lock held"""
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        now = time.time()
+        target = self.max_size * 0.9
+        for entry in entries:
+            stat = entry.stat()
+            if now - stat.st_mtime <= self.ttl and self.size <= target:
+                break
+            try:
+                os.remove(entry.path)
+                self.size -= stat.st_size
+            except OSError:
+                pass
+
+    async def get_async(self, url):
+        return await asyncio.to_thread(self.get, url)
+
+    async def store_async(self, url, body, headers):
+        await asyncio.to_thread(self.store, url, body, headers)
+
+    async def touch_async(self, url):
+        await asyncio.to_thread(self.touch, url)
+
+    async def delete_async(self, url):
+        await asyncio.to_thread(self.delete, url)
+
+    def report(self):
+        print(f"HTTP cache: {self.hits} pages not modified (served from cache), {self.misses} downloaded, "
+              f"{self.size / 1024 / 1024:.1f} MiB on disk")
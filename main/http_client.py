@@ -0,0 +1,72 @@
+import aiohttp
+
+# === CONFIGURATION ===
+# One tuned session per run. Connections are kept alive and reused, so TLS handshakes and DNS lookups happen once
+# per host instead of once per request
+CONNECTION_LIMIT = 100  # Open sockets in total
+LIMIT_PER_HOST = 16  # Open sockets per store, requests above this wait for a free connection
+DNS_CACHE_TTL = 300  # Seconds
+KEEPALIVE_TIMEOUT = 30  # Seconds an idle connection stays open for reuse
+REQUEST_TIMEOUT = 10  # Seconds, used by every request that doesn't set its own
+
+# Brotli is only advertised when the Brotli (or brotlicffi) package is installed, aiohttp can't decode it otherwise
+try:
+    import brotli  # noqa: F401
+    HAS_BROTLI = True
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        HAS_BROTLI = True
+    except ImportError:
+        HAS_BROTLI = False
+ACCEPT_ENCODING = "gzip, deflate, br" if HAS_BROTLI else "gzip, deflate"
+
+
+class ConnectionStats:
+    """Counts new vs reused connections and DNS cache hits, filled by aiohttp's request tracing"""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.dns_hits = 0
+        self.dns_misses = 0
+
+    def trace_config(self):
+        trace = aiohttp.TraceConfig()
+        trace.on_request_end.append(self._count('requests'))
+        trace.on_connection_create_end.append(self._count('new_connections'))
+        trace.on_connection_reuseconn.append(self._count('reused_connections'))
+        trace.on_dns_cache_hit.append(self._count('dns_hits'))
+        trace.on_dns_cache_miss.append(self._count('dns_misses'))
+        return trace
+
+    def _count(self, name):
+        async def handler(session, context, params):
+            setattr(self, name, getattr(self, name) + 1)
+        return handler
+
+    def report(self):
+        connections = self.new_connections + self.reused_connections
+        reuse = self.reused_connections / connections if connections else 0.0
+        print(f"HTTP: {self.requests} requests, {self.new_connections} new connections, "
+              f"{self.reused_connections} reused ({reuse:.0%}), DNS cache {self.dns_hits} hits / {self.dns_misses} misses")
+
+
+stats = ConnectionStats()
+
+
+def create_session(headers=None, limit=CONNECTION_LIMIT, limit_per_host=LIMIT_PER_HOST, dns_cache_ttl=DNS_CACHE_TTL,
+                   keepalive_timeout=KEEPALIVE_TIMEOUT, timeout=REQUEST_TIMEOUT, compression=True):
+    """Session for all outbound requests in main/. Use it as `async with create_session() as session:`
+
+    compression=False asks for uncompressed bodies, otherwise gzip/deflate (and br when available) are negotiated
+    and decoded transparently. Connection reuse shows up in http_client.stats.report().
+    """
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host, ttl_dns_cache=dns_cache_ttl,
+                                     use_dns_cache=True, keepalive_timeout=keepalive_timeout)
+    headers = dict(headers or {})
+    headers.setdefault("Accept-Encoding", ACCEPT_ENCODING if compression else "identity")
+    return aiohttp.ClientSession(connector=connector, headers=headers,
+                                 timeout=aiohttp.ClientTimeout(total=timeout),
+                                 trace_configs=[stats.trace_config()])
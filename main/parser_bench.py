@@ -0,0 +1,140 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+import sys
+import tracemalloc
+from pazar3_scraper import Pazar3Adapter
+from rk5_scraper import Reklama5Adapter
+from it_mk_scraper_js import ItMkAdapter
+
+# Saved pages for each store, one directory per adapter with listing.html and (optionally) detail.html.
+# Parsing regressions show up as a drop in pages/sec or a different ad count, --save/--compare keep a baseline
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+ADAPTERS = {
+    "pazar3": Pazar3Adapter,
+    "reklama5": Reklama5Adapter,
+    "it_mk": ItMkAdapter,
+}
+ITERATIONS = 50
+# Memory is reported twice: tracemalloc only sees Python objects, lxml parses and keeps its trees in libxml2's
+# own allocations. The process's max RSS includes those, but for the whole run, not per page
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+REGRESSION_THRESHOLD = 0.15  # Flag pages/sec drops bigger than 15% against the baseline
+
+
+def load_fixture(store, name):
+    path = os.path.join(FIXTURES_DIR, store, f"{name}.html")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def measure(func, iterations):
+    """Return (pages/sec, peak KiB of Python heap allocated while parsing one page, result of the last call)"""
+    # Adapters print every skipped/parsed ad, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func()  # Warm up
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            result = func()
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return iterations / elapsed, peak / 1024, result
+
+
+def bench_store(store, adapter_cls, iterations):
+    adapter = adapter_cls()
+    rows = []
+
+    listing = load_fixture(store, "listing")
+    if listing is None:
+        return rows
+    rate, peak, ads = measure(lambda: adapter.parse_listing(listing, 1), iterations)
+    rows.append((store, "listing", rate, peak, len(ads)))
+
+    detail = load_fixture(store, "detail")
+    if detail is not None and adapter.fetch_details and ads:
+        template = ads[0]
+
+        def parse_detail():
+            # parse_detail fills the ad in place, start from the listing values every time
+            return adapter.parse_detail(detail, _copy_ad(template))
+
+        rate, peak, ad = measure(parse_detail, iterations)
+        rows.append((store, "detail", rate, peak, int(ad is not None)))
+    return rows
+
+
+def _copy_ad(ad):
+    copy = object.__new__(type(ad))
+    copy.__dict__.update(ad.__dict__)
+    return copy
+
+
+def max_rss_mib():
+    """Peak resident memory of the process so far, None where getrusage isn't available"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024  # Bytes on macOS, KiB on Linux
+
+
+def compare(row, baseline):
+    """Change against the saved run, marked when it is a regression"""
+    previous = baseline.get(f"{row[0]}/{row[1]}")
+    if previous is None:
+        return ""
+    change = row[2] / previous["pages_per_sec"] - 1
+    note = f"{change:+.0%}"
+    if change < -REGRESSION_THRESHOLD:
+        note += " SLOWER"
+    if row[4] != previous["ads"]:
+        note += f" ads was {previous['ads']}"
+    return note
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark store parsers on saved HTML fixtures")
+    arg_parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    arg_parser.add_argument("--stores", nargs="*", default=list(ADAPTERS))
+    arg_parser.add_argument("--save", metavar="FILE", help="Write the results as a baseline")
+    arg_parser.add_argument("--compare", metavar="FILE", help="Show the change against a saved baseline")
+    args = arg_parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+
+    results = {}
+    print(f"{'store':<10} {'page':<8} {'pages/sec':>10} {'py heap KiB':>12} {'ads':>5}  change")
+    print("-" * 62)
+    for store in args.stores:
+        for row in bench_store(store, ADAPTERS[store], args.iterations):
+            print(f"{row[0]:<10} {row[1]:<8} {row[2]:>10.1f} {row[3]:>12.1f} {row[4]:>5}  {compare(row, baseline)}")
+            results[f"{row[0]}/{row[1]}"] = {"pages_per_sec": row[2], "py_heap_kib": row[3], "ads": row[4]}
+
+    rss = max_rss_mib()
+    if rss is not None:
+        print(f"Max RSS of the run (Python and libxml2): {rss:.1f} MiB")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+# === CONFIGURATION ===
+# Per store: max requests in flight and max requests started per second.
+# Throughput scales with these, not with the number of ads on a page
+HOST_LIMITS = {
+    "www.pazar3.mk": {"concurrency": 8, "rate": 10},
+    "www.reklama5.mk": {"concurrency": 8, "rate": 10},
+    "forum.it.mk": {"concurrency": 4, "rate": 4},
+}
+DEFAULT_LIMIT = {"concurrency": 4, "rate": 4}
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostLimiter:
+    def __init__(self, concurrency, rate=None):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate) if rate else None
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self.semaphore:
+            if self.bucket:
+                await self.bucket.acquire()
+            yield
+
+
+_limiters = {}
+
+
+def set_limit(host, concurrency, rate=None):
+    """Override the limit for a host, has to be called before its first request"""
+    HOST_LIMITS[host] = {"concurrency": concurrency, "rate": rate}
+    _limiters.pop(host, None)
+
+
+def limiter_for(url):
+    host = urlparse(url).hostname or ""
+    limiter = _limiters.get(host)
+    if limiter is None:
+        limit = HOST_LIMITS.get(host, DEFAULT_LIMIT)
+        limiter = HostLimiter(limit["concurrency"], limit.get("rate"))
+        _limiters[host] = limiter
+    return limiter
@@ -1,39 +1,29 @@
 import psycopg2
+# Config and migrations import from Web
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../Web')))
 from config import Config
+from migration_utils import migrate
 
 def connect_to_db():
     conn = psycopg2.connect(
         host=Config.DB_HOST,
+        port=int(Config.DB_PORT or 5432),
         database=Config.DB_NAME,
         user=Config.DB_USER,
         password=Config.DB_PASSWORD
     )
     return conn
-#Added store, currency, image_url
-def create_table(conn):
-    with conn.cursor() as cursor:
-        cursor.execute("""
-              CREATE TABLE IF NOT EXISTS ads (
-                id SERIAL PRIMARY KEY,
-                title TEXT,
-                description TEXT,
-                link TEXT,
-                image_url TEXT,
-                category TEXT,
-                phone TEXT,
-                date TEXT
-                price TEXT,
-                currency TEXT,
-                location TEXT,
-                store TEXT
-            )
-        """)
-    conn.commit()
 
+# The table used to be created here, ads.ads and everything around it now comes from Web/migrations
 def setup_database():
     conn = connect_to_db()
-    create_table(conn)
-    conn.close()
+    try:
+        for migration in migrate(conn):
+            print(f"Applied migration {migration.version:04d}_{migration.name}")
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
     setup_database()
@@ -0,0 +1,115 @@
+import asyncio
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# === COLOR CONSTANTS FOR ERROR PRINTS ===
+YELLOW = '\033[33m'
+GREEN = '\033[32m'
+RESET = '\033[0m'
+
+# === CONFIGURATION ===
+RETRIES = 3  # Attempts per request
+BASE_DELAY = 1  # Seconds, doubled on every attempt
+MAX_DELAY = 30
+MAX_RETRY_AFTER = 300  # Longer Retry-After values are capped, the run would stall otherwise
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}  # Anything else (404, 403...) won't change by asking again
+
+# Circuit breaker: when enough of the last requests to a host failed, every request to it waits for the cooldown.
+# Then one probe request goes through, success closes the breaker, failure opens it again for twice as long
+BREAKER_WINDOW = 20
+BREAKER_MIN_REQUESTS = 10
+BREAKER_ERROR_RATE = 0.5
+BREAKER_COOLDOWN = 15
+BREAKER_MAX_COOLDOWN = 300
+PROBE_TIMEOUT = 60  # A probe that never reported back stops blocking the host after this
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+def backoff_delay(attempt, base=BASE_DELAY, cap=MAX_DELAY):
+    """Exponential backoff with full jitter, retries from many tasks don't hit the host at the same moment"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after(headers):
+    """Seconds from a Retry-After header (delta seconds or HTTP date), None if missing or invalid"""
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0), MAX_RETRY_AFTER)
+
+
+class CircuitBreaker:
+    def __init__(self, host):
+        self.host = host
+        self.state = CLOSED
+        self.results = deque(maxlen=BREAKER_WINDOW)  # True for success
+        self.cooldown = BREAKER_COOLDOWN
+        self.open_until = 0.0
+        self.probe_started = None
+
+    async def wait(self):
+        """Blocks while the breaker is open, and while another request probes a half-open host"""
+        while True:
+            now = time.monotonic()
+            if now < self.open_until:
+                await asyncio.sleep(self.open_until - now)
+                continue
+            if self.state == OPEN:
+                self.state = HALF_OPEN
+                self.probe_started = None
+            if self.state == HALF_OPEN:
+                if self.probe_started is not None and now - self.probe_started < PROBE_TIMEOUT:
+                    await asyncio.sleep(1)
+                    continue
+                self.probe_started = now
+            return
+
+    def record(self, success):
+        if self.state == HALF_OPEN:
+            if success:
+                print(f"{GREEN}{self.host}: recovered, resuming requests.{RESET}")
+                self.state = CLOSED
+                self.results.clear()
+                self.cooldown = BREAKER_COOLDOWN
+            else:
+                self.trip(self.cooldown * 2)
+            return
+
+        self.results.append(success)
+        failures = self.results.count(False)
+        if len(self.results) >= BREAKER_MIN_REQUESTS and failures / len(self.results) >= BREAKER_ERROR_RATE:
+            self.trip(self.cooldown)
+
+    def trip(self, cooldown):
+        self.cooldown = min(cooldown, BREAKER_MAX_COOLDOWN)
+        self.pause(self.cooldown)
+        print(f"{YELLOW}{self.host}: too many errors, pausing requests for {self.cooldown:.0f}s.{RESET}")
+
+    def pause(self, seconds):
+        # Also used for Retry-After, the server told us when to come back
+        self.state = OPEN
+        self.open_until = max(self.open_until, time.monotonic() + seconds)
+        self.results.clear()
+
+
+_breakers = {}
+
+
+def breaker_for(url):
+    host = urlparse(url).hostname or ""
+    breaker = _breakers.get(host)
+    if breaker is None:
+        breaker = _breakers[host] = CircuitBreaker(host)
+    return breaker
@@ -0,0 +1,35 @@
+import argparse
+import asyncio
+from crawl_engine import CrawlEngine, PARSE_WORKERS
+from http_cache import HttpCache
+from pazar3_scraper import Pazar3Adapter
+from rk5_scraper import Reklama5Adapter
+from it_mk_scraper_js import ItMkAdapter
+
+# Stores that can be run, by name: python run_scrapers.py pazar3 reklama5 --workers 4 --incremental
+ADAPTERS = {
+    "pazar3": Pazar3Adapter,
+    "reklama5": Reklama5Adapter,
+    "it.mk": ItMkAdapter,
+}
+DEFAULT_STORES = ["pazar3", "reklama5"]
+
+
+async def main(stores, workers=PARSE_WORKERS, incremental=False, cache=True):
+    # All stores share one HTTP session, one writer, one DB pool and one pool of parse processes,
+    # each store keeps its own rate limit
+    adapters = [ADAPTERS[store]() for store in stores]
+    await CrawlEngine(adapters, parse_workers=workers, incremental=incremental,
+                      cache=HttpCache() if cache else None).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run store scrapers")
+    parser.add_argument("stores", nargs="*", choices=list(ADAPTERS))
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS,
+                        help="Processes parsing pages, 0 parses on the event loop")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip ads already in the database and stop at the first page with only known ads")
+    parser.add_argument("--no-cache", action="store_true", help="Always download full pages")
+    args = parser.parse_args()
+    asyncio.run(main(args.stores or DEFAULT_STORES, args.workers, args.incremental, not args.no_cache))